@@ -1,6 +1,7 @@
 -- Tables
 create table if not exists public.user_profile (
 	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null default auth.uid() references auth.users (id) on delete cascade,
 	date date not null,
 	weight numeric,
 	height numeric,
@@ -11,12 +12,14 @@ create table if not exists public.user_profile (
 
 create table if not exists public.weight_log (
 	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null default auth.uid() references auth.users (id) on delete cascade,
 	date date not null,
 	weight numeric
 );
 
 create table if not exists public.diet_log (
 	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null default auth.uid() references auth.users (id) on delete cascade,
 	date date not null,
 	meal_type text,
 	food_name text,
@@ -28,36 +31,137 @@ create table if not exists public.diet_log (
 
 create table if not exists public.workout_log (
 	id uuid primary key default gen_random_uuid(),
+	user_id uuid not null default auth.uid() references auth.users (id) on delete cascade,
 	date date not null,
 	exercise_name text,
 	duration_minutes int,
 	calories_burned numeric
 );
 
+-- Every query is scoped to one user, so indexes lead with user_id. The id column
+-- completes the (date, id) keyset used to page through a user's rows.
+create index if not exists user_profile_user_date_idx on public.user_profile (user_id, date, id);
+create index if not exists weight_log_user_date_idx on public.weight_log (user_id, date, id);
+create index if not exists diet_log_user_date_idx on public.diet_log (user_id, date, id);
+create index if not exists workout_log_user_date_idx on public.workout_log (user_id, date, id);
+
+-- Per-user, per-day totals maintained by triggers on diet_log and workout_log
+create table if not exists public.daily_rollup (
+	user_id uuid not null references auth.users (id) on delete cascade,
+	date date not null,
+	calories numeric not null default 0,
+	protein numeric not null default 0,
+	carbs numeric not null default 0,
+	fat numeric not null default 0,
+	meal_count int not null default 0,
+	calories_burned numeric not null default 0,
+	duration_minutes numeric not null default 0,
+	workout_count int not null default 0,
+	primary key (user_id, date)
+);
+
+create or replace function public.apply_daily_rollup(
+	p_user_id uuid, p_date date,
+	p_calories numeric, p_protein numeric, p_carbs numeric, p_fat numeric, p_meals int,
+	p_burned numeric, p_duration numeric, p_workouts int
+) returns void language sql security definer set search_path = public as $$
+	insert into public.daily_rollup as r
+		(user_id, date, calories, protein, carbs, fat, meal_count, calories_burned, duration_minutes, workout_count)
+	values (
+		p_user_id, p_date,
+		coalesce(p_calories, 0), coalesce(p_protein, 0), coalesce(p_carbs, 0), coalesce(p_fat, 0), p_meals,
+		coalesce(p_burned, 0), coalesce(p_duration, 0), p_workouts
+	)
+	on conflict (user_id, date) do update set
+		calories = r.calories + excluded.calories,
+		protein = r.protein + excluded.protein,
+		carbs = r.carbs + excluded.carbs,
+		fat = r.fat + excluded.fat,
+		meal_count = r.meal_count + excluded.meal_count,
+		calories_burned = r.calories_burned + excluded.calories_burned,
+		duration_minutes = r.duration_minutes + excluded.duration_minutes,
+		workout_count = r.workout_count + excluded.workout_count;
+	delete from public.daily_rollup
+	where user_id = p_user_id and date = p_date and meal_count <= 0 and workout_count <= 0;
+$$;
+
+-- Only the triggers below may call it: it runs as the owner and trusts p_user_id,
+-- and Supabase grants execute on new public functions to the API roles
+revoke execute on function public.apply_daily_rollup(uuid, date, numeric, numeric, numeric, numeric, int, numeric, numeric, int)
+	from public, anon, authenticated;
+
+create or replace function public.diet_log_rollup() returns trigger
+language plpgsql security definer set search_path = public as $$
+begin
+	if tg_op in ('UPDATE', 'DELETE') then
+		perform public.apply_daily_rollup(old.user_id, old.date, -old.calories, -old.protein, -old.carbs, -old.fat, -1, 0, 0, 0);
+	end if;
+	if tg_op in ('INSERT', 'UPDATE') then
+		perform public.apply_daily_rollup(new.user_id, new.date, new.calories, new.protein, new.carbs, new.fat, 1, 0, 0, 0);
+	end if;
+	return null;
+end;
+$$;
+
+create or replace function public.workout_log_rollup() returns trigger
+language plpgsql security definer set search_path = public as $$
+begin
+	if tg_op in ('UPDATE', 'DELETE') then
+		perform public.apply_daily_rollup(old.user_id, old.date, 0, 0, 0, 0, 0, -old.calories_burned, -old.duration_minutes, -1);
+	end if;
+	if tg_op in ('INSERT', 'UPDATE') then
+		perform public.apply_daily_rollup(new.user_id, new.date, 0, 0, 0, 0, 0, new.calories_burned, new.duration_minutes, 1);
+	end if;
+	return null;
+end;
+$$;
+
+drop trigger if exists diet_log_rollup on public.diet_log;
+create trigger diet_log_rollup after insert or update or delete on public.diet_log
+	for each row execute function public.diet_log_rollup();
+
+drop trigger if exists workout_log_rollup on public.workout_log;
+create trigger workout_log_rollup after insert or update or delete on public.workout_log
+	for each row execute function public.workout_log_rollup();
+
+-- Backfill the rollup from rows that existed before the triggers
+insert into public.daily_rollup
+	(user_id, date, calories, protein, carbs, fat, meal_count, calories_burned, duration_minutes, workout_count)
+select
+	user_id, date,
+	sum(calories), sum(protein), sum(carbs), sum(fat), sum(meal_count),
+	sum(calories_burned), sum(duration_minutes), sum(workout_count)
+from (
+	select user_id, date, coalesce(calories, 0) as calories, coalesce(protein, 0) as protein,
+		coalesce(carbs, 0) as carbs, coalesce(fat, 0) as fat, 1 as meal_count,
+		0 as calories_burned, 0 as duration_minutes, 0 as workout_count
+	from public.diet_log
+	union all
+	select user_id, date, 0, 0, 0, 0, 0, coalesce(calories_burned, 0), coalesce(duration_minutes, 0), 1
+	from public.workout_log
+) as entries
+where user_id is not null
+group by user_id, date
+on conflict (user_id, date) do nothing;
+
 -- Enable Row Level Security
 alter table public.user_profile enable row level security;
 alter table public.weight_log enable row level security;
 alter table public.diet_log enable row level security;
 alter table public.workout_log enable row level security;
+alter table public.daily_rollup enable row level security;
+
+-- Each signed-in user reads and writes only their own rows. (select auth.uid()) is
+-- evaluated once per statement rather than per row, so the user_id indexes serve it.
+create policy "own rows" on public.user_profile for all to authenticated
+	using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
+create policy "own rows" on public.weight_log for all to authenticated
+	using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
+create policy "own rows" on public.diet_log for all to authenticated
+	using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
+create policy "own rows" on public.workout_log for all to authenticated
+	using (user_id = (select auth.uid())) with check (user_id = (select auth.uid()));
 
--- Simple permissive policies for a single-user personal app
--- If you later add auth, scope rows to auth.uid()
-create policy "allow all select" on public.user_profile for select using (true);
-create policy "allow all insert" on public.user_profile for insert with check (true);
-create policy "allow all update" on public.user_profile for update using (true) with check (true);
-create policy "allow all delete" on public.user_profile for delete using (true);
-
-create policy "allow all select" on public.weight_log for select using (true);
-create policy "allow all insert" on public.weight_log for insert with check (true);
-create policy "allow all update" on public.weight_log for update using (true) with check (true);
-create policy "allow all delete" on public.weight_log for delete using (true);
-
-create policy "allow all select" on public.diet_log for select using (true);
-create policy "allow all insert" on public.diet_log for insert with check (true);
-create policy "allow all update" on public.diet_log for update using (true) with check (true);
-create policy "allow all delete" on public.diet_log for delete using (true);
-
-create policy "allow all select" on public.workout_log for select using (true);
-create policy "allow all insert" on public.workout_log for insert with check (true);
-create policy "allow all update" on public.workout_log for update using (true) with check (true);
-create policy "allow all delete" on public.workout_log for delete using (true);
+-- The rollup is written only by the triggers above
+create policy "own rows" on public.daily_rollup for select to authenticated
+	using (user_id = (select auth.uid()));
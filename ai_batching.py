@@ -0,0 +1,147 @@
+"""Coalescing of concurrent AI requests across sessions.
+
+``SingleFlight`` lets identical in-flight requests share one upstream call.
+``RequestBatcher`` gathers distinct prompts that arrive within a short window
+and hands them to a batch function as one list, so the upstream API sees a
+single request with several inputs.
+"""
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SingleFlight:
+    """Share one call between concurrent callers asking for the same key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared}
+
+
+class RequestBatcher:
+    """Collect prompts for ``window`` seconds and send each parameter group as one batch.
+
+    ``send_batch(prompts, parameters)`` returns one result per prompt, in
+    order. An exception from it is raised to every caller in the batch.
+    """
+
+    def __init__(self, send_batch: Callable[[List[str], Dict[str, Any]], List[Any]],
+                 window: float = 0.025, max_batch_size: int = 8, max_workers: int = 4):
+        self.send_batch = send_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.prompts = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        # Batches are sent concurrently so a slow one doesn't hold up the next window
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-batch")
+
+    def submit(self, prompt: str, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("RequestBatcher has been shut down")
+            self._queue.put((prompt, parameters, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="ai-batcher", daemon=True)
+                self._worker.start()
+        return future.result(timeout)
+
+    def shutdown(self) -> None:
+        """Send what is already queued, then stop the worker and the executor"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._worker is not None:
+                # The worker shuts the executor down once it reaches this
+                self._queue.put(None)
+                return
+        self._executor.shutdown(wait=False)
+
+    def _run(self) -> None:
+        closing = False
+        while not closing:
+            item = self._queue.get()
+            if item is None:
+                break
+            items = [item]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                items.append(item)
+            # Upstream APIs take one set of generation parameters per request
+            groups: Dict[str, list] = {}
+            for item in items:
+                groups.setdefault(json.dumps(item[1], sort_keys=True), []).append(item)
+            for group in groups.values():
+                self._executor.submit(self._send, group)
+        # Batches already submitted still run; only the threads go away afterwards
+        self._executor.shutdown(wait=False)
+
+    def _send(self, group: list) -> None:
+        with self._lock:
+            self.batches += 1
+            self.prompts += len(group)
+        try:
+            results = self.send_batch([item[0] for item in group], group[0][1])
+            if len(results) != len(group):
+                raise RuntimeError(f"expected {len(group)} results from the batch, got {len(results)}")
+        except BaseException as e:
+            for item in group:
+                item[2].set_exception(e)
+            return
+        for item, result in zip(group, results):
+            item[2].set_result(result)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "mean_batch_size": self.prompts / self.batches if self.batches else 0.0,
+            }
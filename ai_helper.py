@@ -1,57 +1,477 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 import streamlit as st
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Union
 import os
+import pandas as pd
+
+from analytics import progress_features, progress_summary as summarize_progress
+from ai_batching import RequestBatcher, SingleFlight
+from ai_router import Provider, ProviderError, ProviderRouter
+from local_model import get_local_generator
+
+class ResponseCache:
+    """Bounded LRU cache of AI responses with a time-to-live.
+    
+    Keys are derived from (model, prompt, parameters). Entries optionally
+    persist to a JSON file so they survive restarts.
+    """
+    
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 6 * 3600, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+    
+    @staticmethod
+    def make_key(model: str, prompt: str, parameters: Dict[str, Any]) -> str:
+        payload = json.dumps([model, prompt, parameters], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._save()
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+    
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (expires_at, value) in stored.items():
+            if expires_at > now:
+                self._entries[key] = (expires_at, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+
+def _setting(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a setting from the environment, then Streamlit secrets"""
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
+
+
+# Shared by every session in the process
+response_cache = ResponseCache(
+    max_entries=int(_setting("AI_CACHE_MAX_ENTRIES", "256")),
+    ttl_seconds=float(_setting("AI_CACHE_TTL_SECONDS", str(6 * 3600))),
+    path=_setting("AI_CACHE_PATH"),
+)
+
+# Identical prompts in flight at the same time, from any session, share one upstream call
+inflight = SingleFlight()
+
+HF_API_URL = "https://api-inference.huggingface.co/models"
+GROQ_API_URL = "https://api.groq.com/openai/v1"
+OPENAI_API_URL = "https://api.openai.com/v1"
+# Separate connect and read timeouts: connecting should be quick, generating may not be
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0
+
+
+def build_http_session(retries: int = 3, backoff_factor: float = 1.0, pool_size: int = 10) -> requests.Session:
+    """Keep-alive session that retries "model loading" responses with exponential backoff"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=(503, 524),
+        allowed_methods=frozenset({"POST"}),
+        backoff_factor=backoff_factor,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared by every session in the process so connections to the API are reused
+http_session = build_http_session(
+    retries=int(_setting("AI_HTTP_RETRIES", "3")),
+    backoff_factor=float(_setting("AI_HTTP_BACKOFF", "1.0")),
+)
+
+def iter_sse_text(resp: requests.Response, cancel: Optional[threading.Event] = None) -> Iterator[str]:
+    """Text chunks from a server-sent event stream.
+    
+    Understands Hugging Face text-generation events ({"token": {"text": ...}})
+    and OpenAI-compatible chunks ({"choices": [{"delta": {"content": ...}}]}),
+    which Groq and OpenAI both send. Stops early once ``cancel`` is set.
+    """
+    resp.encoding = "utf-8"
+    for line in resp.iter_lines(decode_unicode=True):
+        if cancel is not None and cancel.is_set():
+            return
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        if not isinstance(event, dict):
+            continue
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        token = event.get("token")
+        if isinstance(token, dict):
+            text = None if token.get("special") else token.get("text")
+        else:
+            choices = event.get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+        if text:
+            yield text
+
+
+def _generated_text(data: Any) -> Optional[str]:
+    # flan-t5 returns a list of dicts with 'generated_text'
+    if isinstance(data, list) and data:
+        return data[0].get("generated_text", "")
+    # some models return dict with 'generated_text'
+    if isinstance(data, dict) and "generated_text" in data:
+        return data["generated_text"]
+    return None
+
+
+# Runs AI calls off the Streamlit script thread; shared so reruns don't spawn new threads
+ai_executor = ThreadPoolExecutor(
+    max_workers=int(_setting("AI_MAX_WORKERS", "8")),
+    thread_name_prefix="health-ai",
+)
+
+# Everything HealthAI reads from settings; a change to any of them rebuilds the shared instance
+HEALTH_AI_SETTINGS = (
+    "HUGGINGFACE_TOKEN", "OPENAI_API_KEY", "GROQ_API_KEY", "HF_MODEL", "GROQ_MODEL", "OPENAI_MODEL",
+    "LOCAL_AI_MODEL", "HF_API_URL", "GROQ_API_URL", "OPENAI_API_URL", "AI_CONNECT_TIMEOUT",
+    "AI_READ_TIMEOUT", "AI_BATCH_WINDOW", "AI_MAX_BATCH", "AI_HEDGE_AFTER", "AI_BREAKER_FAILURES",
+    "AI_BREAKER_COOLDOWN", "LOCAL_AI_BATCH_WINDOW", "LOCAL_AI_MAX_BATCH",
+)
+
+# How often get_health_ai() reads the settings again to notice a change
+SETTINGS_CHECK_SECONDS = 10.0
+
+def _settings_snapshot() -> Tuple[Optional[str], ...]:
+    return tuple(_setting(name) for name in HEALTH_AI_SETTINGS)
 
 class HealthAI:
     """AI helper for health management app using free APIs"""
     
     def __init__(self):
-        self.huggingface_token = st.secrets.get("HUGGINGFACE_TOKEN", os.environ.get("HUGGINGFACE_TOKEN"))
-        self.openai_key = st.secrets.get("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY"))
-        self.groq_key = st.secrets.get("GROQ_API_KEY", os.environ.get("GROQ_API_KEY"))
+        self.settings = _settings_snapshot()
+        self.huggingface_token = _setting("HUGGINGFACE_TOKEN")
+        self.openai_key = _setting("OPENAI_API_KEY")
+        self.groq_key = _setting("GROQ_API_KEY")
         # Use a reliably available free model
-        self.hf_model = os.environ.get("HF_MODEL", st.secrets.get("HF_MODEL", "google/flan-t5-base"))
+        self.hf_model = _setting("HF_MODEL", "google/flan-t5-base")
+        self.groq_model = _setting("GROQ_MODEL", "llama-3.1-8b-instant")
+        self.openai_model = _setting("OPENAI_MODEL", "gpt-4o-mini")
+        # In-process model on CPU, e.g. "google/flan-t5-base"; needs transformers and torch
+        self.local_model = _setting("LOCAL_AI_MODEL")
+        self.api_url = _setting("HF_API_URL", HF_API_URL).rstrip("/")
+        self.groq_url = _setting("GROQ_API_URL", GROQ_API_URL).rstrip("/")
+        self.openai_url = _setting("OPENAI_API_URL", OPENAI_API_URL).rstrip("/")
+        self.timeout = (
+            float(_setting("AI_CONNECT_TIMEOUT", str(CONNECT_TIMEOUT))),
+            float(_setting("AI_READ_TIMEOUT", str(READ_TIMEOUT))),
+        )
+        self.cache = response_cache
+        self.http = http_session
+        # Distinct prompts arriving together are sent to Hugging Face as one `inputs` list
+        self.hf_batcher = RequestBatcher(
+            self._hf_complete_batch,
+            window=float(_setting("AI_BATCH_WINDOW", "0.025")),
+            max_batch_size=int(_setting("AI_MAX_BATCH", "8")),
+        )
+        self.router = ProviderRouter(
+            self._providers(),
+            hedge_after=float(_setting("AI_HEDGE_AFTER", "3.0")),
+            failure_threshold=int(_setting("AI_BREAKER_FAILURES", "3")),
+            cooldown_seconds=float(_setting("AI_BREAKER_COOLDOWN", "30")),
+        )
+        # Any configured provider may answer, so cache entries are keyed on the whole set
+        self.cache_model = ",".join(f"{p.name}:{p.model}" for p in self.router.providers)
+    
+    def _providers(self) -> List[Provider]:
+        providers = []
+        if self.huggingface_token:
+            providers.append(Provider("huggingface", self.hf_model, self._hf_complete, self._hf_stream))
+        for name, key, base_url, model in (
+            ("groq", self.groq_key, self.groq_url, self.groq_model),
+            ("openai", self.openai_key, self.openai_url, self.openai_model),
+        ):
+            if key:
+                providers.append(Provider(
+                    name, model,
+                    partial(self._chat_complete, base_url, key, model),
+                    partial(self._chat_stream, base_url, key, model),
+                ))
+        if self.local_model:
+            providers.append(Provider("local", self.local_model, self._local_complete, self._local_stream))
+        return providers
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics of the shared response cache"""
+        return self.cache.stats()
+    
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """How many calls were shared in flight or sent in batches"""
+        return {"single_flight": inflight.stats(), "hf_batches": self.hf_batcher.stats()}
+    
+    def provider_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Rolling latency, error rate and circuit state per AI provider"""
+        return self.router.stats()
+    
+    def shutdown(self) -> None:
+        """Stop this instance's batching and hedging threads once their requests finish"""
+        self.hf_batcher.shutdown()
+        self.router.shutdown()
+
+    def _status_message(self, status_code: int, model: Optional[str] = None) -> str:
+        if status_code in (503, 524):
+            return "Model is loading. Please try again in a few seconds."
+        if status_code == 404:
+            if model is not None:
+                return f"Model not found: {model}."
+            return f"Model not found or gated: {self.hf_model}. Try setting HF_MODEL to a public model like 'google/flan-t5-base'."
+        return f"AI service error: {status_code}"
 
-    def _hf_generate(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7) -> str:
-        if not self.huggingface_token:
-            return "AI not configured. Add HUGGINGFACE_TOKEN to secrets."
+    def _hf_request(self, inputs: Union[str, List[str]], parameters: Dict[str, Any], stream: bool) -> requests.Response:
         headers = {
             "Authorization": f"Bearer {self.huggingface_token}",
             "Content-Type": "application/json",
         }
         payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": max_new_tokens,
-                "temperature": temperature,
-            },
+            "inputs": inputs,
+            "parameters": parameters,
             "options": {"wait_for_model": True}
         }
-        url = f"https://api-inference.huggingface.co/models/{self.hf_model}"
+        if stream:
+            headers["Accept"] = "text/event-stream"
+            payload["stream"] = True
+        url = f"{self.api_url}/{self.hf_model}"
+        # 503/524 while the model loads are retried by the session before we see them
+        return self.http.post(url, headers=headers, data=json.dumps(payload), timeout=self.timeout, stream=stream)
+
+    def _hf_complete_batch(self, prompts: List[str], parameters: Dict[str, Any]) -> List[Optional[str]]:
+        # A lone prompt is sent as a plain string, exactly as before batching
+        resp = self._hf_request(prompts[0] if len(prompts) == 1 else prompts, parameters, stream=False)
+        if resp.status_code != 200:
+            raise ProviderError(self._status_message(resp.status_code))
+        data = resp.json()
+        if len(prompts) == 1:
+            return [_generated_text(data)]
+        if not isinstance(data, list):
+            raise ProviderError("(no text returned)")
+        # Batched answers come back as one item per input, either a dict or a one-element list
+        return [_generated_text(item if isinstance(item, list) else [item]) for item in data]
+
+    def _hf_complete(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        text = self.hf_batcher.submit(prompt, parameters)
+        if not text:
+            raise ProviderError("(empty response)" if text == "" else "(no text returned)")
+        return text
+
+    def _hf_stream(self, prompt: str, parameters: Dict[str, Any],
+                   cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        resp = self._hf_request(prompt, parameters, stream=True)
+        try:
+            if resp.status_code != 200:
+                raise ProviderError(self._status_message(resp.status_code))
+            if "text/event-stream" in resp.headers.get("Content-Type", ""):
+                yield from iter_sse_text(resp, cancel)
+            else:
+                # Models without streaming support answer with the whole text at once
+                text = _generated_text(resp.json())
+                if text:
+                    yield text
+        finally:
+            resp.close()
+
+    def _chat_request(self, base_url: str, key: str, model: str, prompt: str,
+                      parameters: Dict[str, Any], stream: bool) -> requests.Response:
+        """POST to an OpenAI-compatible chat completions endpoint (Groq, OpenAI)"""
+        headers = {
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": parameters["max_new_tokens"],
+            "temperature": parameters["temperature"],
+            "stream": stream,
+        }
+        return self.http.post(f"{base_url}/chat/completions", headers=headers, data=json.dumps(payload),
+                              timeout=self.timeout, stream=stream)
+
+    def _chat_complete(self, base_url: str, key: str, model: str, prompt: str, parameters: Dict[str, Any]) -> str:
+        resp = self._chat_request(base_url, key, model, prompt, parameters, stream=False)
+        if resp.status_code != 200:
+            raise ProviderError(self._status_message(resp.status_code, model))
+        choices = resp.json().get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content")
+        if not text:
+            raise ProviderError("(no text returned)")
+        return text
+
+    def _chat_stream(self, base_url: str, key: str, model: str, prompt: str, parameters: Dict[str, Any],
+                     cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        resp = self._chat_request(base_url, key, model, prompt, parameters, stream=True)
+        try:
+            if resp.status_code != 200:
+                raise ProviderError(self._status_message(resp.status_code, model))
+            yield from iter_sse_text(resp, cancel)
+        finally:
+            resp.close()
+
+    def _local_complete(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        generator = get_local_generator(
+            self.local_model,
+            batch_window=float(_setting("LOCAL_AI_BATCH_WINDOW", "0.02")),
+            max_batch_size=int(_setting("LOCAL_AI_MAX_BATCH", "8")),
+        )
+        try:
+            text = generator.generate(prompt, timeout=self.timeout[1], **parameters)
+        except ImportError as e:
+            raise ProviderError(str(e)) from e
+        if not text:
+            raise ProviderError("(empty response)")
+        return text
+
+    def _local_stream(self, prompt: str, parameters: Dict[str, Any],
+                      cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        # Batched generation returns whole answers, so the stream is a single chunk
+        yield self._local_complete(prompt, parameters)
+
+    def _complete(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7) -> str:
+        parameters = {
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+        }
+        cache_key = self.cache.make_key(self.cache_model, prompt, parameters)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            text = inflight.do(cache_key, lambda: self.router.complete(prompt, parameters))
+        except ProviderError as e:
+            return str(e)
+        # Only successful generations are cached; errors are retried next time
+        self.cache.set(cache_key, text)
+        return text
+
+    def _stream(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7,
+                cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        """Yield generated text chunk by chunk as the provider streams it.
+        
+        The read timeout applies between chunks rather than to the whole
+        generation. Closing the generator or setting ``cancel`` drops the
+        connection, so an abandoned generation stops straight away.
+        """
+        parameters = {
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+        }
+        # Shares cache entries with _complete
+        cache_key = self.cache.make_key(self.cache_model, prompt, parameters)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
         try:
-            resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
-            if resp.status_code == 200:
-                data = resp.json()
-                # flan-t5 returns a list of dicts with 'generated_text'
-                if isinstance(data, list) and data:
-                    return data[0].get("generated_text", "") or "(empty response)"
-                # some models return dict with 'generated_text'
-                if isinstance(data, dict) and "generated_text" in data:
-                    return data["generated_text"]
-                return "(no text returned)"
-            if resp.status_code in (503, 524):
-                return "Model is loading. Please try again in a few seconds."
-            if resp.status_code == 404:
-                return f"Model not found or gated: {self.hf_model}. Try setting HF_MODEL to a public model like 'google/flan-t5-base'."
-            return f"AI service error: {resp.status_code}"
+            for chunk in self.router.stream(prompt, parameters, cancel):
+                parts.append(chunk)
+                yield chunk
+        except ProviderError as e:
+            yield str(e)
+            return
         except Exception as e:
-            return f"AI request failed: {e}"
+            yield f"AI request failed: {e}"
+            return
+        if cancel is not None and cancel.is_set():
+            return
+        text = "".join(parts)
+        if text:
+            self.cache.set(cache_key, text)
+        else:
+            yield "(empty response)"
+
+    def _generate(self, prompt: str, max_new_tokens: int, temperature: float,
+                  stream: bool = False) -> Union[str, Iterator[str]]:
+        if stream:
+            return self._stream(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
+        return self._complete(prompt, max_new_tokens=max_new_tokens, temperature=temperature)
     
-    def get_health_insights(self, user_data: Dict[str, Any]) -> str:
+    def get_health_insights(self, user_data: Dict[str, Any], stream: bool = False) -> Union[str, Iterator[str]]:
         """Get personalized health insights using Hugging Face"""
-        if not self.huggingface_token:
+        if not self.router.providers:
             return "AI insights not available. Please configure Hugging Face token."
         
         try:
@@ -72,11 +492,13 @@ class HealthAI:
                 "provide concise, practical insights (3-5 bullet points) covering calories, macros, "
                 "activity, and a simple next step.\n\n" + data_summary
             )
-            return self._hf_generate(prompt, max_new_tokens=220, temperature=0.6)
+            return self._generate(prompt, max_new_tokens=220, temperature=0.6, stream=stream)
+        except Exception as e:
+            return f"AI request failed: {e}"
     
-    def get_meal_recommendations(self, user_profile: Dict[str, Any], meal_type: str) -> str:
+    def get_meal_recommendations(self, user_profile: Dict[str, Any], meal_type: str, stream: bool = False) -> Union[str, Iterator[str]]:
         """Get AI-powered meal recommendations"""
-        if not self.huggingface_token:
+        if not self.router.providers:
             return "AI recommendations not available. Please configure Hugging Face token."
         
         try:
@@ -86,11 +508,13 @@ class HealthAI:
             Weight: {user_profile.get('weight', 'N/A')} kg, Height: {user_profile.get('height', 'N/A')} cm.
             Focus on vegetarian options with balanced nutrition.
             """
-            return self._hf_generate(prompt, max_new_tokens=160, temperature=0.8)
+            return self._generate(prompt, max_new_tokens=160, temperature=0.8, stream=stream)
+        except Exception as e:
+            return f"AI request failed: {e}"
     
-    def get_workout_suggestions(self, user_profile: Dict[str, Any], available_time: int) -> str:
+    def get_workout_suggestions(self, user_profile: Dict[str, Any], available_time: int, stream: bool = False) -> Union[str, Iterator[str]]:
         """Get AI-powered workout suggestions"""
-        if not self.huggingface_token:
+        if not self.router.providers:
             return "AI workout suggestions not available. Please configure Hugging Face token."
         
         try:
@@ -100,32 +524,31 @@ class HealthAI:
             Weight: {user_profile.get('weight', 'N/A')} kg, Height: {user_profile.get('height', 'N/A')} cm.
             Include exercises that can be done at home or gym.
             """
-            return self._hf_generate(prompt, max_new_tokens=200, temperature=0.7)
+            return self._generate(prompt, max_new_tokens=200, temperature=0.7, stream=stream)
+        except Exception as e:
+            return f"AI request failed: {e}"
     
-    def analyze_progress(self, weight_history: List[Dict], diet_history: List[Dict], workout_history: List[Dict]) -> str:
+    def analyze_progress(self, weight_history: pd.DataFrame, diet_history: pd.DataFrame, workout_history: pd.DataFrame, stream: bool = False) -> Union[str, Iterator[str]]:
         """Analyze user's health progress using AI"""
-        if not self.huggingface_token:
+        if not self.router.providers:
             return "AI progress analysis not available. Please configure Hugging Face token."
         
         try:
-            # Prepare progress summary
-            progress_summary = f"""
-            Health Progress Analysis:
-            - Weight entries: {len(weight_history)}
-            - Diet entries: {len(diet_history)}
-            - Workout entries: {len(workout_history)}
-            - Recent weight trend: {'Improving' if len(weight_history) > 1 else 'Starting journey'}
-            - Activity consistency: {'Good' if len(workout_history) > 3 else 'Needs improvement'}
-            """
+            # Prepare progress summary from statistics over the full logs
+            progress_summary = "Health Progress Analysis:\n" + summarize_progress(
+                progress_features(weight_history, diet_history, workout_history)
+            )
             prompt = (
                 "Summarize this health progress in 3-5 encouraging bullet points and one next action: "
                 + progress_summary
             )
-            return self._hf_generate(prompt, max_new_tokens=240, temperature=0.75)
+            return self._generate(prompt, max_new_tokens=240, temperature=0.75, stream=stream)
+        except Exception as e:
+            return f"AI request failed: {e}"
     
-    def get_motivational_message(self, user_goals: str, recent_activity: str) -> str:
+    def get_motivational_message(self, user_goals: str, recent_activity: str, stream: bool = False) -> Union[str, Iterator[str]]:
         """Get AI-powered motivational messages"""
-        if not self.huggingface_token:
+        if not self.router.providers:
             return "AI motivation not available. Please configure Hugging Face token."
         
         try:
@@ -134,7 +557,60 @@ class HealthAI:
             Recent activity: {recent_activity}
             Make it encouraging and specific to their health journey.
             """
-            return self._hf_generate(prompt, max_new_tokens=120, temperature=0.9)
+            return self._generate(prompt, max_new_tokens=120, temperature=0.9, stream=stream)
+        except Exception as e:
+            return f"AI request failed: {e}"
+
+    def generate_panels(
+        self,
+        user_data: Dict[str, Any],
+        user_profile: Dict[str, Any],
+        meal_type: str = "healthy meal",
+        available_time: int = 30,
+        progress: Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]] = None,
+    ) -> Iterator[Tuple[str, str]]:
+        """Generate the dashboard panels concurrently.
+        
+        Yields (panel, text) pairs as each call finishes, so the slowest
+        call bounds the total wait. Panels are "insights", "meals",
+        "workout" and, when progress histories are given, "progress".
+        """
+        calls = {
+            "insights": (self.get_health_insights, (user_data,)),
+            "meals": (self.get_meal_recommendations, (user_profile, meal_type)),
+            "workout": (self.get_workout_suggestions, (user_profile, available_time)),
+        }
+        if progress is not None:
+            calls["progress"] = (self.analyze_progress, progress)
+        futures = {ai_executor.submit(fn, *args): panel for panel, (fn, args) in calls.items()}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], f"AI request failed: {e}"
+
+_health_ai: Optional[HealthAI] = None
+_health_ai_checked = 0.0
+_health_ai_lock = threading.Lock()
+
+def get_health_ai() -> HealthAI:
+    """Process-wide HealthAI shared by every session and rerun.
 
-# Initialize AI helper
-health_ai = HealthAI()
+    Built on first use rather than at import. Every SETTINGS_CHECK_SECONDS
+    the settings are read again, and a fresh instance replaces this one if a
+    key, model or URL has changed (e.g. secrets edited while the server
+    runs); the replaced instance is shut down. Dropped HTTP connections need
+    no check here: the pooled session reopens them on the next request.
+    """
+    global _health_ai, _health_ai_checked
+    with _health_ai_lock:
+        now = time.monotonic()
+        if _health_ai is not None and now - _health_ai_checked < SETTINGS_CHECK_SECONDS:
+            return _health_ai
+        settings = _settings_snapshot()
+        _health_ai_checked = now
+        if _health_ai is None or _health_ai.settings != settings:
+            replaced, _health_ai = _health_ai, HealthAI()
+            if replaced is not None:
+                replaced.shutdown()
+        return _health_ai
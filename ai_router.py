@@ -0,0 +1,244 @@
+"""Latency-aware routing of AI requests across several providers.
+
+Each provider keeps a rolling window of latencies and outcomes. Requests go
+to the fastest healthy provider; if it has not answered after its p95
+latency (or ``hedge_after`` until there is enough history) a duplicate is sent
+to the next one and the first answer wins. A provider that fails
+``failure_threshold`` times in a row, or more often than ``max_error_rate``
+over the window, is skipped for ``cooldown_seconds``; after that a single
+trial request decides whether it comes back, while other requests keep
+skipping it.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Any
+
+
+class ProviderError(Exception):
+    """A provider could not produce a response; the message is user-facing."""
+
+
+NOT_CONFIGURED = "AI not configured. Add HUGGINGFACE_TOKEN, GROQ_API_KEY or OPENAI_API_KEY to secrets."
+UNAVAILABLE = "AI is temporarily unavailable. Please try again in a moment."
+
+
+class Provider(NamedTuple):
+    name: str
+    model: str
+    # complete(prompt, parameters) -> text
+    complete: Callable[[str, Dict[str, Any]], str]
+    # stream(prompt, parameters, cancel) -> text chunks
+    stream: Callable[[str, Dict[str, Any], Optional[threading.Event]], Iterator[str]]
+
+
+class ProviderStats:
+    """Rolling latency and error window plus circuit breaker for one provider"""
+
+    def __init__(self, window: int = 50, failure_threshold: int = 3, cooldown_seconds: float = 30.0,
+                 max_error_rate: float = 0.5, min_samples: int = 10):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        # Non-zero while the circuit is open or half-open (cooldown over, awaiting a trial)
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def available(self, now: float) -> bool:
+        """Whether a request may be sent now, without claiming the trial"""
+        if not self.open_until:
+            return True
+        return now >= self.open_until and not self.trial_in_flight
+
+    def admit(self, now: float) -> bool:
+        """Like ``available``, but a half-open circuit lets only this caller through"""
+        if not self.available(now):
+            return False
+        if self.open_until:
+            self.trial_in_flight = True
+        return True
+
+    def record(self, latency: Optional[float], ok: bool) -> None:
+        self.trial_in_flight = False
+        self.outcomes.append(ok)
+        if ok:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+        else:
+            self.consecutive_failures += 1
+            flaky = len(self.outcomes) >= self.min_samples and self.error_rate > self.max_error_rate
+            # A failed trial after a cooldown (open_until already set) re-opens straight away
+            if self.consecutive_failures >= self.failure_threshold or flaky or self.open_until:
+                self.open_until = time.monotonic() + self.cooldown_seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def circuit_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+
+class ProviderRouter:
+    """Send each request to the fastest healthy provider, hedging slow ones"""
+
+    def __init__(self, providers: List[Provider], hedge_after: float = 3.0, max_error_rate: float = 0.5,
+                 failure_threshold: int = 3, cooldown_seconds: float = 30.0, max_workers: int = 16):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self._stats = {
+            p.name: ProviderStats(failure_threshold=failure_threshold, cooldown_seconds=cooldown_seconds,
+                                  max_error_rate=max_error_rate)
+            for p in providers
+        }
+        self._lock = threading.Lock()
+        # Separate from the panel executor so hedged requests never wait behind the calls that issued them
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-router")
+
+    def ranked(self) -> List[Provider]:
+        """Providers that may be tried, in order; open circuits are left out and half-open ones go last"""
+        def key(provider):
+            stats = self._stats[provider.name]
+            p50 = stats.percentile(0.5)
+            # Providers without history sort first so they get measured
+            return (bool(stats.open_until), p50 or 0.0)
+
+        with self._lock:
+            now = time.monotonic()
+            return sorted((p for p in self.providers if self._stats[p.name].available(now)), key=key)
+
+    def _admit(self, provider: Provider) -> bool:
+        with self._lock:
+            return self._stats[provider.name].admit(time.monotonic())
+
+    def _no_provider_error(self) -> ProviderError:
+        return ProviderError(UNAVAILABLE if self.providers else NOT_CONFIGURED)
+
+    def _record(self, provider: Provider, latency: Optional[float], ok: bool) -> None:
+        with self._lock:
+            self._stats[provider.name].record(latency, ok)
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        with self._lock:
+            stats = self._stats[provider.name]
+            # A p95 over a handful of samples would hedge far too eagerly
+            if len(stats.latencies) < stats.min_samples:
+                return self.hedge_after
+            return stats.percentile(0.95)
+
+    def _timed(self, provider: Provider, prompt: str, parameters: Dict[str, Any]) -> str:
+        start = time.monotonic()
+        try:
+            text = provider.complete(prompt, parameters)
+        except ProviderError:
+            self._record(provider, None, False)
+            raise
+        except Exception as e:
+            self._record(provider, None, False)
+            raise ProviderError(f"AI request failed: {e}") from e
+        self._record(provider, time.monotonic() - start, True)
+        return text
+
+    def complete(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        """First successful response, failing over and hedging across providers"""
+        queue = self.ranked()
+        pending = {}
+        errors = []
+
+        def launch():
+            # A half-open provider whose trial another request has claimed meanwhile is passed over
+            while queue:
+                provider = queue.pop(0)
+                if self._admit(provider):
+                    pending[self._executor.submit(self._timed, provider, prompt, parameters)] = provider
+                    return time.monotonic() + self._hedge_delay(provider)
+            return None
+
+        hedge_at = launch()
+        if hedge_at is None:
+            raise self._no_provider_error()
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if queue else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The slowest-percentile wait has passed: duplicate to the next provider
+                hedge_at = launch() or hedge_at
+                continue
+            for future in done:
+                del pending[future]
+                try:
+                    return future.result()
+                except ProviderError as e:
+                    errors.append(e)
+            if not pending and queue:
+                hedge_at = launch() or hedge_at
+        raise errors[-1] if errors else self._no_provider_error()
+
+    def stream(self, prompt: str, parameters: Dict[str, Any],
+               cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        """Stream from the best provider, failing over until one yields its first chunk.
+
+        Streams are not hedged; a duplicate stream would double the token
+        cost for the whole answer rather than one request.
+        """
+        errors = []
+        for provider in self.ranked():
+            if not self._admit(provider):
+                continue
+            chunks = provider.stream(prompt, parameters, cancel)
+            try:
+                try:
+                    first = next(chunks, "")
+                except ProviderError as e:
+                    self._record(provider, None, False)
+                    errors.append(e)
+                    continue
+                except Exception as e:
+                    self._record(provider, None, False)
+                    errors.append(ProviderError(f"AI request failed: {e}"))
+                    continue
+                # Time to first chunk is not comparable with full responses, so only the outcome counts
+                self._record(provider, None, True)
+                if first:
+                    yield first
+                yield from chunks
+                return
+            finally:
+                chunks.close()
+        if errors:
+            raise errors[-1]
+        raise self._no_provider_error()
+
+    def shutdown(self) -> None:
+        """Release the hedging threads once requests in flight have finished"""
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-provider latency percentiles, error rate and circuit state"""
+        with self._lock:
+            return {
+                name: {
+                    "requests": len(stats.outcomes),
+                    "p50": stats.percentile(0.5),
+                    "p95": stats.percentile(0.95),
+                    "error_rate": stats.error_rate,
+                    "circuit_open": stats.circuit_open,
+                }
+                for name, stats in self._stats.items()
+            }
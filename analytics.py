@@ -0,0 +1,250 @@
+"""Vectorised calculations over the health logs and the daily rollup.
+
+Run ``python analytics.py`` for a small benchmark of these functions on
+synthetic multi-year data, and of the typed table schema against the dtypes
+``pd.read_csv`` infers.
+"""
+import numpy as np
+import pandas as pd
+
+from storage import select_date_range, daily_totals, apply_schema
+
+BALANCE_WINDOWS = {
+    'Last 7 days': 7,
+    'Last 30 days': 30,
+    'Last 90 days': 90,
+    'Last 365 days': 365,
+    'All time': None,
+}
+
+
+def calorie_balance(rollup, end, days=None):
+    """Daily consumed, burned and net calories for a calendar window.
+
+    ``rollup`` is the date-sorted daily rollup and ``end`` an ISO date. The
+    window covers the ``days`` days up to and including ``end`` (the whole
+    history when ``days`` is None). Every calendar day in the window gets a
+    row, with 0 for days that have no entries.
+    """
+    if rollup.empty:
+        return pd.DataFrame(columns=['date', 'consumed', 'burned', 'net'])
+    end_day = np.datetime64(end, 'D')
+    if days is None:
+        start_day = np.datetime64(rollup['date'].iloc[0], 'D')
+    else:
+        start_day = end_day - np.timedelta64(days - 1, 'D')
+    window = select_date_range(rollup, str(start_day), str(end_day))
+    calendar = np.arange(start_day, end_day + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+    offsets = (window['date'].to_numpy().astype('datetime64[D]') - start_day).astype(np.int64)
+    consumed = np.zeros(len(calendar))
+    burned = np.zeros(len(calendar))
+    consumed[offsets] = window['calories'].to_numpy()
+    burned[offsets] = window['calories_burned'].to_numpy()
+    return pd.DataFrame({'date': calendar, 'consumed': consumed, 'burned': burned,
+                         'net': consumed - burned})
+
+
+# Energy per gram of each macronutrient
+MACRO_KCAL = {'protein': 4, 'carbs': 4, 'fat': 9}
+FEATURE_WINDOWS = (7, 30)
+
+
+def _days(values):
+    return np.asarray(values).astype('datetime64[D]')
+
+
+def _streaks(flags):
+    """Current and longest run of True; the current run may end yesterday"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    if len(starts) == 0:
+        return 0, 0
+    current = int(ends[-1] - starts[-1]) if ends[-1] >= len(flags) - 1 else 0
+    return current, int((ends - starts).max())
+
+
+def _mean(values):
+    return float(values.mean()) if len(values) else None
+
+
+def progress_features(weight_log, diet_log, workout_log, end=None):
+    """Summary statistics of the logs for the AI progress analysis.
+
+    Everything is computed with array operations over the DataFrames, so
+    years of history cost milliseconds. ``end`` is an ISO date (today by
+    default); windows are the ``FEATURE_WINDOWS`` days up to it. Values
+    that can't be computed from the data are None.
+    """
+    end_day = np.datetime64(end or pd.Timestamp.today().strftime('%Y-%m-%d'), 'D')
+    features = {
+        'weight_entries': len(weight_log),
+        'diet_entries': len(diet_log),
+        'workout_entries': len(workout_log),
+    }
+
+    # Weight: rolling averages and the least-squares trend
+    weight_days = _days(weight_log['date']) if len(weight_log) else np.array([], dtype='datetime64[D]')
+    weights = pd.to_numeric(weight_log['weight'], errors='coerce').to_numpy(dtype=float) if len(weight_log) else np.array([])
+    valid = np.isfinite(weights)
+    weight_days, weights = weight_days[valid], weights[valid]
+    features['current_weight'] = float(weights[-1]) if len(weights) else None
+    for window in FEATURE_WINDOWS:
+        recent = weight_days > end_day - np.timedelta64(window, 'D')
+        features[f'weight_avg_{window}d'] = _mean(weights[recent])
+    features['weight_slope_kg_per_week'] = None
+    if len(weights) >= 2:
+        x = (weight_days - weight_days[0]).astype(float)
+        x -= x.mean()
+        if x.any():
+            features['weight_slope_kg_per_week'] = float((x * (weights - weights.mean())).sum() / (x * x).sum() * 7)
+
+    # Diet and workouts per calendar day
+    diet = daily_totals('diet_log', diet_log)
+    workouts = daily_totals('workout_log', workout_log)
+    logged = [_days(frame.index) for frame in (diet, workouts) if len(frame)]
+    first_day = min(days[0] for days in logged) if logged else end_day
+    start_day = min(first_day, end_day - np.timedelta64(max(FEATURE_WINDOWS) - 1, 'D'))
+    n_days = int((end_day - start_day).astype(int)) + 1
+
+    def on_calendar(frame, column):
+        values = np.zeros(n_days)
+        if len(frame):
+            offsets = (_days(frame.index) - start_day).astype(np.int64)
+            keep = (offsets >= 0) & (offsets < n_days)
+            values[offsets[keep]] = frame[column].to_numpy(dtype=float)[keep]
+        return values
+
+    consumed = on_calendar(diet, 'calories')
+    burned = on_calendar(workouts, 'calories_burned')
+    meal_days = on_calendar(diet, 'meal_count') > 0
+    workout_days = on_calendar(workouts, 'workout_count') > 0
+    macros = {name: on_calendar(diet, name) for name in MACRO_KCAL}
+
+    for window in FEATURE_WINDOWS:
+        tail = slice(n_days - window, n_days)
+        logged_days = meal_days[tail]
+        # Days without any meal logged are unknown, not zero-calorie days
+        features[f'calories_avg_{window}d'] = _mean(consumed[tail][logged_days])
+        features[f'workout_days_{window}d'] = int(workout_days[tail].sum())
+        features[f'logged_days_{window}d'] = int(logged_days.sum())
+    tail = slice(n_days - 30, n_days)
+    net = (consumed - burned)[tail][meal_days[tail]]
+    features['net_calories_avg_30d'] = _mean(net)
+    features['net_calories_std_30d'] = float(net.std()) if len(net) > 1 else None
+
+    kcal = {name: macros[name][tail].sum() * factor for name, factor in MACRO_KCAL.items()}
+    total = sum(kcal.values())
+    for name in MACRO_KCAL:
+        features[f'{name}_share_30d'] = float(kcal[name] / total) if total else None
+
+    features['logging_streak'], features['longest_logging_streak'] = _streaks(meal_days)
+    features['workout_streak'], features['longest_workout_streak'] = _streaks(workout_days)
+    return features
+
+
+def progress_summary(features):
+    """Compact plain-text rendering of ``progress_features`` for a prompt"""
+    def fmt(value, spec):
+        return 'n/a' if value is None else format(value, spec)
+
+    lines = [
+        f"- Entries: {features['weight_entries']} weight, {features['diet_entries']} meals, "
+        f"{features['workout_entries']} workouts",
+        f"- Weight: {fmt(features['current_weight'], '.1f')} kg now; 7-day avg {fmt(features['weight_avg_7d'], '.1f')}, "
+        f"30-day avg {fmt(features['weight_avg_30d'], '.1f')}; trend {fmt(features['weight_slope_kg_per_week'], '+.2f')} kg/week",
+        f"- Calories eaten per logged day: 7-day {fmt(features['calories_avg_7d'], '.0f')}, "
+        f"30-day {fmt(features['calories_avg_30d'], '.0f')}",
+        f"- Net calories (eaten - burned), 30 days: mean {fmt(features['net_calories_avg_30d'], '.0f')}, "
+        f"std {fmt(features['net_calories_std_30d'], '.0f')}",
+        f"- Macros by energy, 30 days: protein {fmt(features['protein_share_30d'], '.0%')}, "
+        f"carbs {fmt(features['carbs_share_30d'], '.0%')}, fat {fmt(features['fat_share_30d'], '.0%')}",
+        f"- Meals logged on {features['logged_days_7d']}/7 and {features['logged_days_30d']}/30 days; "
+        f"streak {features['logging_streak']} days (best {features['longest_logging_streak']})",
+        f"- Workouts on {features['workout_days_7d']}/7 and {features['workout_days_30d']}/30 days; "
+        f"streak {features['workout_streak']} days (best {features['longest_workout_streak']})",
+    ]
+    return "\n".join(lines)
+
+
+def _synthetic_rollup(years):
+    rng = np.random.default_rng(0)
+    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=365 * years, freq='D')
+    # Leave roughly one day in ten empty so the calendar fill is exercised
+    dates = dates[rng.random(len(dates)) > 0.1]
+    n = len(dates)
+    # Typed as load_data returns it, so the benchmark times the app's path
+    return apply_schema(pd.DataFrame({
+        'date': dates,
+        'calories': rng.normal(2000, 300, n),
+        'calories_burned': rng.normal(350, 120, n).clip(0),
+        'meal_count': rng.integers(1, 5, n),
+        'workout_count': rng.integers(0, 2, n),
+    }), 'daily_rollup')
+
+
+def _synthetic_logs(years):
+    rng = np.random.default_rng(0)
+    days = pd.date_range(end=pd.Timestamp.today().normalize(), periods=365 * years, freq='D')
+    weight_days = days[rng.random(len(days)) > 0.3]
+    meal_days = np.repeat(days, 3)[rng.random(3 * len(days)) > 0.1]
+    workout_days = days[rng.random(len(days)) > 0.5]
+    as_dates = lambda index: index.strftime('%Y-%m-%d').astype(object)
+    weight_log = pd.DataFrame({
+        'date': as_dates(weight_days),
+        'weight': 80 - np.linspace(0, 5, len(weight_days)) + rng.normal(0, 0.5, len(weight_days)),
+    })
+    diet_log = pd.DataFrame({
+        'date': as_dates(meal_days),
+        'meal_type': rng.choice(['Breakfast', 'Lunch', 'Dinner', 'Snack'], len(meal_days)).astype(object),
+        'calories': rng.normal(650, 150, len(meal_days)),
+        'protein': rng.normal(30, 8, len(meal_days)),
+        'carbs': rng.normal(80, 20, len(meal_days)),
+        'fat': rng.normal(20, 6, len(meal_days)),
+    })
+    workout_log = pd.DataFrame({
+        'date': as_dates(workout_days),
+        'exercise_name': rng.choice(['Walking', 'Running', 'Cycling', 'Yoga', 'Swimming'],
+                                    len(workout_days)).astype(object),
+        'duration_minutes': rng.integers(20, 90, len(workout_days)),
+        'calories_burned': rng.normal(350, 120, len(workout_days)).clip(0),
+    })
+    return weight_log, diet_log, workout_log
+
+
+def _benchmark():
+    import timeit
+
+    for years in (1, 5, 20):
+        rollup = _synthetic_rollup(years)
+        end = rollup['date'].iloc[-1].strftime('%Y-%m-%d')
+        for label, days in BALANCE_WINDOWS.items():
+            runs = 200
+            seconds = timeit.timeit(lambda: calorie_balance(rollup, end, days), number=runs) / runs
+            print(f"{years:>2} years  {label:<14} {seconds * 1000:7.3f} ms")
+    for years in (1, 5, 20):
+        logs = _synthetic_logs(years)
+        runs = 50
+        seconds = timeit.timeit(lambda: progress_features(*logs), number=runs) / runs
+        print(f"{years:>2} years  progress features {seconds * 1000:7.3f} ms ({sum(map(len, logs))} rows)")
+
+    # Inferred (object dates and labels, float64) against typed columns
+    for years in (5, 20):
+        _, diet_log, _ = _synthetic_logs(years)
+        typed = apply_schema(diet_log, 'diet_log')
+        start = str(np.datetime64(pd.Timestamp.today().normalize(), 'D') - np.timedelta64(90, 'D'))
+        for label, frame in (('inferred', diet_log), ('typed', typed)):
+            bytes_per_row = frame.memory_usage(index=False, deep=True).sum() / len(frame)
+            dates = frame['date']
+            bound = pd.Timestamp(start) if label == 'typed' else start
+            runs = 50
+            timings = {
+                'filter': lambda: frame[(dates >= bound) & (frame['meal_type'] == 'Lunch')],
+                'groupby': lambda: frame.groupby(['date', 'meal_type'], observed=True)['calories'].sum(),
+            }
+            results = '  '.join(f"{name} {timeit.timeit(fn, number=runs) / runs * 1000:7.3f} ms"
+                                for name, fn in timings.items())
+            print(f"{years:>2} years  diet log {label:<8} {bytes_per_row:6.1f} B/row  {results}")
+
+
+if __name__ == '__main__':
+    _benchmark()
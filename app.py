@@ -1,12 +1,30 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
+import functools
+import importlib.util
 import os
+import sys
+import time
 from typing import Optional
 
+from storage import (read_table, read_date_range, write_table, write_chunks, append_rows, new_row_id,
+                     ensure_row_ids, sort_by_date, select_date_range, table_exists, user_path, table_cache,
+                     table_lock, apply_schema, to_records, apply_rollup, ROLLUP_COLUMNS, ROLLUP_SOURCES,
+                     TABLE_COLUMNS)
+from analytics import calorie_balance, BALANCE_WINDOWS
+
+LOG_FILES = ('weight_log.csv', 'diet_log.csv', 'workout_log.csv')
+ROLLUP_FILE = 'daily_rollup.csv'
+# Rows parsed at a time from an imported CSV, and rows per Supabase upsert while importing
+IMPORT_CHUNK_ROWS = 20000
+IMPORT_UPSERT_BATCH = 500
+# Tables in a backup, rows written at a time when exporting, and the per-user record of the last backup
+EXPORT_FILES = ('user_profile.csv', 'weight_log.csv', 'diet_log.csv', 'workout_log.csv')
+EXPORT_CHUNK_ROWS = 20000
+BACKUP_MANIFEST = 'backup_manifest.npz'
+
 # Page configuration
 st.set_page_config(
     page_title="Personal Health Manager",
@@ -340,81 +358,346 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Enhanced data storage functions with session state backup
-def load_data(filename):
-    """Load data from CSV file with session state backup"""
-    # First try to load from session state (persists during session)
-    session_key = f"data_{filename.replace('.csv', '')}"
-    if session_key in st.session_state:
-        return st.session_state[session_key]
-    
-    # Fallback to CSV file
-    if os.path.exists(filename):
-        data = pd.read_csv(filename)
-        # Store in session state for persistence
-        st.session_state[session_key] = data
+def current_user_id():
+    """Id of the signed-in user, or None for the single-user layout"""
+    auth = st.session_state.get('auth')
+    return auth['user_id'] if auth else None
+
+def load_data(filename, user_id=None):
+    """Load the user's table from the process-wide cache, reading the file on a miss.
+
+    Every session gets a copy-on-write view of the same cached frame, and any
+    write (from any session) replaces it, so there are no stale per-session copies.
+    """
+    user_id = user_id or current_user_id()
+    path = user_path(filename, user_id)
+    data = table_cache.get(path)
+    if data is not None:
+        return data
+    
+    # Fallback to the user's CSV file (plus any journalled appends)
+    version = table_cache.version(path)
+    data = read_table(path)
+    if data is not None:
+        # The rollup too: an upserted day is replayed after the days that follow it
+        if filename in LOG_FILES or filename == ROLLUP_FILE:
+            data = sort_by_date(data)
+        if filename != ROLLUP_FILE and ensure_row_ids(data):
+            write_table(data, path)
+        else:
+            table_cache.put(path, data, version)
         return data
     return pd.DataFrame()
 
-def save_data(data, filename):
-    """Save data to both CSV file and session state"""
-    # Save to CSV file
-    data.to_csv(filename, index=False)
-    
-    # Also save to session state for persistence
-    session_key = f"data_{filename.replace('.csv', '')}"
-    st.session_state[session_key] = data
+def save_data(data, filename, user_id=None):
+    """Save data to the user's CSV file, which also replaces the cached copy"""
+    user_id = user_id or current_user_id()
+    table = filename.replace('.csv', '')
+    data = apply_schema(data, table)
+    if filename != ROLLUP_FILE:
+        ensure_row_ids(data)
+    if filename in LOG_FILES:
+        data = sort_by_date(data)
+    # Atomically replace the user's CSV file
+    write_table(data, user_path(filename, user_id))
+    
+    # A replaced log is re-aggregated into the daily rollup
+    if table in ROLLUP_SOURCES:
+        update_daily_rollup(table, data, replace=True, user_id=user_id)
 
-def export_data():
-    """Export all data as downloadable files"""
-    data_files = {
-        'user_profile.csv': load_data('user_profile.csv'),
-        'weight_log.csv': load_data('weight_log.csv'),
-        'diet_log.csv': load_data('diet_log.csv'),
-        'workout_log.csv': load_data('workout_log.csv')
-    }
-    
-    # Create a zip file with all data
+def update_daily_rollup(table, rows, replace=False, user_id=None):
+    """Fold new (or, with replace, all) rows of a log into the daily rollup.
+    
+    New rows only change their own days, so just those rollup rows are
+    recomputed and upserted by date; a replaced log rewrites the rollup.
+    Sessions share the rollup, so it is read and written back under its lock;
+    otherwise two sessions logging on the same day would each write their own
+    total and the later one would win.
+    """
+    with table_lock(user_path(ROLLUP_FILE, user_id)):
+        rollup = load_data(ROLLUP_FILE, user_id)
+        if rollup.empty:
+            rollup = pd.DataFrame(columns=ROLLUP_COLUMNS)
+        if replace:
+            save_data(apply_rollup(rollup, table, rows, replace=True), ROLLUP_FILE, user_id)
+            return
+        days = rollup[rollup['date'].isin(rows['date'])] if not rollup.empty else rollup
+        touched = apply_schema(apply_rollup(days, table, rows), 'daily_rollup')
+        append_rows(user_path(ROLLUP_FILE, user_id), to_records(touched))
+
+def rebuild_rollup_days(table, days, user_id=None):
+    """Recompute one log's share of the rollup for the given days from the log itself.
+    
+    Used when rows were replaced rather than added, so their old values can't
+    simply be summed on top. Falls back to rebuilding the log's columns in full
+    if a day is left without entries, since appending cannot remove its row.
+    """
+    with table_lock(user_path(ROLLUP_FILE, user_id)):
+        rollup = load_data(ROLLUP_FILE, user_id)
+        if rollup.empty:
+            rollup = pd.DataFrame(columns=ROLLUP_COLUMNS)
+        log = load_data(f"{table}.csv", user_id)
+        current = rollup[rollup['date'].isin(days)]
+        entries = log[log['date'].isin(days)] if not log.empty else log
+        touched = apply_rollup(current, table, entries, replace=True)
+        if not current['date'].isin(touched['date']).all():
+            save_data(apply_rollup(rollup, table, log, replace=True), ROLLUP_FILE, user_id)
+            return
+        append_rows(user_path(ROLLUP_FILE, user_id), to_records(apply_schema(touched, 'daily_rollup')))
+
+def append_data(rows, filename, user_id=None):
+    """Append new log rows without rewriting the whole history"""
+    user_id = user_id or current_user_id()
+    rows = [dict(row, id=row.get('id') or new_row_id()) for row in rows]
+    # Also carries the cached copy forward, still in the date order fetch_range relies on
+    append_rows(user_path(filename, user_id), rows)
+    
+    table = filename.replace('.csv', '')
+    if table in ROLLUP_SOURCES:
+        update_daily_rollup(table, apply_schema(pd.DataFrame(rows), table), user_id=user_id)
+    return rows
+
+def fetch_range(table, start, end, columns=None, user_id=None):
+    """Get log rows dated between start and end (inclusive).
+    
+    A cached table is binary searched in memory. On a cache miss the SQLite
+    backend answers from its date index rather than loading the whole history.
+    """
+    path = user_path(f"{table}.csv", user_id or current_user_id())
+    data = table_cache.get(path)
+    if data is None:
+        window = read_date_range(path, start, end, columns)
+        if window is not None:
+            return window
+        data = load_data(f"{table}.csv", user_id)
+    return select_date_range(data, start, end, columns)
+
+def row_hashes(data, table):
+    """A 64-bit hash of each row over the table's columns, to tell which rows changed.
+    
+    Missing values hash alike whatever the column's dtype, so a column one
+    backend leaves out and another stores as all empty give the same hashes.
+    Strings are hashed as Python objects, so rows go EXPORT_CHUNK_ROWS at a time.
+    """
+    data = data.reindex(columns=TABLE_COLUMNS[table])
+    hashes = np.zeros(len(data), dtype='uint64')
+    for start in range(0, len(data), EXPORT_CHUNK_ROWS):
+        part = data.iloc[start:start + EXPORT_CHUNK_ROWS]
+        combined = hashes[start:start + EXPORT_CHUNK_ROWS]
+        for column in part.columns:
+            values = pd.util.hash_pandas_object(part[column], index=False).to_numpy()
+            combined[:] = combined * np.uint64(1000003) ^ np.where(part[column].isna().to_numpy(), 0, values)
+    return hashes
+
+def load_backup_manifest(path):
+    """Creation time and sorted row hashes per table of the last backup, or None if there was none"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as manifest:
+        return {name: manifest[name] for name in manifest.files}
+
+def save_backup_manifest(path, created, hashes):
+    """Atomically replace the manifest with one export's row hashes"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, created=np.array(created), **{table: np.sort(h) for table, h in hashes.items()})
+    os.replace(tmp, path)
+
+def _write_parquet(member, data):
+    """Write a frame to an open zip member as Parquet, one row group per EXPORT_CHUNK_ROWS rows"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    # Inferred from the whole frame so a slice with an all-empty column can't change it
+    schema = pa.Schema.from_pandas(data, preserve_index=False)
+    with pq.ParquetWriter(member, schema, compression='zstd') as writer:
+        for start in range(0, len(data), EXPORT_CHUNK_ROWS):
+            writer.write_table(pa.Table.from_pandas(data.iloc[start:start + EXPORT_CHUNK_ROWS],
+                                                    schema=schema, preserve_index=False))
+
+def export_data(tables, manifest_path, columnar=False, differential=False):
+    """Build a backup archive of ``tables`` (file name -> frame) and return its bytes.
+    
+    Each table is streamed into its zip member EXPORT_CHUNK_ROWS rows at a
+    time, as CSV or with columnar as Parquet, and the zip itself is written
+    to a temporary file, so no table is ever held as one CSV string. Every
+    export saves a hash of each row to the manifest at ``manifest_path``;
+    with differential, only rows that are new or changed since that last
+    manifest are written. The archive's manifest.json tells import whether
+    to replace the tables or merge the rows in.
+    """
+    import json
+    import tempfile
     import zipfile
-    import io
     
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, data in data_files.items():
-            if not data.empty:
-                csv_data = data.to_csv(index=False)
-                zip_file.writestr(filename, csv_data)
-    
-    zip_buffer.seek(0)
-    return zip_buffer.getvalue()
+    previous = load_backup_manifest(manifest_path) if differential else None
+    created = datetime.now().isoformat(timespec='seconds')
+    manifest = {
+        'kind': 'full' if previous is None else 'differential',
+        'format': 'parquet' if columnar else 'csv',
+        'created': created,
+        'since': None if previous is None else str(previous['created']),
+        'rows': {},
+    }
+    hashes = {}
+    with tempfile.TemporaryFile() as buffer:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename, data in tables.items():
+                table = filename.replace('.csv', '')
+                hashes[table] = row_hashes(data, table)
+                # The app never deletes rows, so new and changed rows are the whole difference
+                if previous is not None and table in previous and len(previous[table]):
+                    known = previous[table]
+                    found = known[np.minimum(np.searchsorted(known, hashes[table]), len(known) - 1)]
+                    data = data[found != hashes[table]]
+                if data.empty:
+                    continue
+                manifest['rows'][table] = len(data)
+                if columnar:
+                    # Parquet is compressed already, and a stored member is cheap to seek in on import
+                    info = zipfile.ZipInfo(f"{table}.parquet", date_time=time.localtime()[:6])
+                    with archive.open(info, 'w') as member:
+                        _write_parquet(member, data)
+                else:
+                    with archive.open(filename, 'w') as member:
+                        data.to_csv(member, index=False, chunksize=EXPORT_CHUNK_ROWS)
+            archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+        # Only once the archive is complete does it become the base for the next differential
+        save_backup_manifest(manifest_path, created, hashes)
+        buffer.seek(0)
+        return buffer.read()
+
+def _import_chunks(member, table, stats, columnar=False):
+    """Validated, typed chunks of one archived table (CSV, or Parquet with columnar)"""
+    columns = TABLE_COLUMNS[table]
+    if columnar:
+        import pyarrow.parquet as pq
+        batches = (batch.to_pandas() for batch in pq.ParquetFile(member).iter_batches(batch_size=IMPORT_CHUNK_ROWS))
+    else:
+        batches = pd.read_csv(member, chunksize=IMPORT_CHUNK_ROWS)
+    for chunk in batches:
+        if 'date' not in chunk.columns:
+            raise ValueError(f"{table} has no date column")
+        # Columns the app doesn't keep (such as another account's user_id) are dropped
+        chunk = apply_schema(chunk[[c for c in chunk.columns if c in columns]], table)
+        valid = chunk['date'].notna()
+        if not valid.all():
+            stats['skipped'] += int((~valid).sum())
+            chunk = chunk[valid].reset_index(drop=True)
+        ensure_row_ids(chunk)
+        yield chunk
 
-def import_data(uploaded_file):
-    """Import data from uploaded file"""
+def import_data(uploaded_file, upload=False):
+    """Import a backup archive, streaming each table into storage chunk by chunk.
+    
+    Members (CSV or Parquet) are read straight from the uploaded zip and
+    parsed IMPORT_CHUNK_ROWS rows at a time, so memory is bounded by a chunk
+    rather than the archive. A full backup replaces each table it contains;
+    a differential one is merged in by row id. Rows without a valid date are
+    skipped, and the daily rollup is rebuilt from the imported logs. With
+    upload, rows are also upserted to Supabase in batches of IMPORT_UPSERT_BATCH.
+    """
     try:
+        import json
         import zipfile
-        import io
         
-        # Read the uploaded file
-        file_content = uploaded_file.read()
+        user_id = current_user_id()
+        client = data_client() if upload else None
+        stats = {'rows': 0, 'skipped': 0, 'uploaded': 0}
+        upload_error = None
+        remote_tables = {}
+        if client is not None:
+            try:
+                remote_tables = get_schema(supabase_client)
+            except Exception as e:
+                upload_error = e
+        bar = st.progress(0.0, text="Importing data...")
+        started = time.monotonic()
         
-        # Extract CSV files from zip
-        with zipfile.ZipFile(io.BytesIO(file_content), 'r') as zip_file:
-            for filename in zip_file.namelist():
-                if filename.endswith('.csv'):
-                    csv_data = zip_file.read(filename).decode('utf-8')
-                    data = pd.read_csv(io.StringIO(csv_data))
+        with zipfile.ZipFile(uploaded_file) as archive:
+            members = []
+            manifest = {}
+            for info in archive.infolist():
+                table, suffix = os.path.splitext(os.path.basename(info.filename))
+                if info.filename == 'manifest.json':
+                    manifest = json.loads(archive.read(info))
+                elif suffix in ('.csv', '.parquet') and table in TABLE_COLUMNS and table != 'daily_rollup':
+                    members.append((info, table))
+                elif not info.is_dir():
+                    st.warning(f"Skipped {info.filename}: not one of this app's tables")
+            differential = manifest.get('kind') == 'differential'
+            total_bytes = sum(info.file_size for info, _ in members) or 1
+            done_bytes = 0
+            
+            for info, table in members:
+                path = user_path(f"{table}.csv", user_id)
+                # A merged log's rollup is rebuilt from the whole table afterwards instead
+                rollup = load_data(ROLLUP_FILE, user_id) if table in ROLLUP_SOURCES and not differential else None
+                replace = True
+                
+                def chunks(member):
+                    nonlocal rollup, replace, upload_error
+                    for chunk in _import_chunks(member, table, stats, columnar=info.filename.endswith('.parquet')):
+                        if rollup is not None:
+                            # Rebuilt from the first chunk, then added to; one row per day stays small
+                            rollup = apply_rollup(rollup, table, chunk, replace=replace)
+                            replace = False
+                        if client is not None and upload_error is None and table in remote_tables:
+                            records = to_records(chunk)
+                            try:
+                                for offset in range(0, len(records), IMPORT_UPSERT_BATCH):
+                                    batch = [clean_row(row) for row in records[offset:offset + IMPORT_UPSERT_BATCH]]
+                                    upsert_rows(client, table, batch)
+                                    user_delta_sync(user_id).mark_synced(table, batch)
+                                    stats['uploaded'] += len(batch)
+                            except Exception as e:
+                                upload_error = e
+                        yield chunk
+                
+                with archive.open(info) as member:
+                    def report(rows):
+                        rate = (stats['rows'] + rows) / max(time.monotonic() - started, 1e-6)
+                        bar.progress(min((done_bytes + member.tell()) / total_bytes, 1.0),
+                                     text=f"{table}: {rows:,} rows ({rate:,.0f} rows/s)")
                     
-                    # Save to session state and CSV
-                    session_key = f"data_{filename.replace('.csv', '')}"
-                    st.session_state[session_key] = data
-                    data.to_csv(filename, index=False)
+                    if differential:
+                        # Appended rows replace any existing row with the same id
+                        rows = 0
+                        for chunk in chunks(member):
+                            append_rows(path, to_records(chunk))
+                            rows += len(chunk)
+                            report(rows)
+                        stats['rows'] += rows
+                    else:
+                        stats['rows'] += write_chunks(path, chunks(member), report)
+                done_bytes += info.file_size
+                if rollup is not None:
+                    save_data(rollup, ROLLUP_FILE, user_id)
+                elif differential and table in ROLLUP_SOURCES:
+                    update_daily_rollup(table, load_data(f"{table}.csv", user_id), replace=True, user_id=user_id)
         
+        elapsed = time.monotonic() - started
+        summary = (f"Imported {stats['rows']:,} rows in {elapsed:.1f} s "
+                   f"({stats['rows'] / max(elapsed, 1e-6):,.0f} rows/s)")
+        if differential:
+            summary += f", merging the changes since {manifest.get('since')}"
+        if stats['skipped']:
+            summary += f"; skipped {stats['skipped']:,} rows without a valid date"
+        if client is not None:
+            summary += f"; uploaded {stats['uploaded']:,} rows to Supabase"
+        if upload_error is not None:
+            summary += f" (upload stopped: {upload_error})"
+        bar.progress(1.0, text=summary)
+        # Shown again after the rerun that follows a successful import
+        st.session_state['import_summary'] = summary
         return True
     except Exception as e:
         st.error(f"Error importing data: {str(e)}")
         return False
 
-def init_data_files():
-    """Initialize data files if they don't exist"""
+def init_data_files(user_id=None):
+    """Initialize the user's data files if they don't exist"""
+    user_id = user_id or current_user_id()
     data_files = {
         'user_profile.csv': pd.DataFrame(columns=['date', 'weight', 'height', 'age', 'gender', 'activity_level']),
         'weight_log.csv': pd.DataFrame(columns=['date', 'weight']),
@@ -423,8 +706,15 @@ def init_data_files():
     }
     
     for filename, default_df in data_files.items():
-        if not os.path.exists(filename):
-            save_data(default_df, filename)
+        if not table_exists(user_path(filename, user_id)):
+            save_data(default_df, filename, user_id)
+    
+    # Build the daily rollup once from existing logs
+    if not table_exists(user_path(ROLLUP_FILE, user_id)):
+        rollup = pd.DataFrame(columns=ROLLUP_COLUMNS)
+        for table in ROLLUP_SOURCES:
+            rollup = apply_rollup(rollup, table, load_data(f"{table}.csv", user_id), replace=True)
+        save_data(rollup, ROLLUP_FILE, user_id)
 
 # Initialize data files
 init_data_files()
@@ -432,17 +722,210 @@ init_data_files()
 # Supabase integration
 supabase_client: Optional[object] = None
 try:
-    from supabase_client import get_supabase_client, fetch_all, upsert_rows
+    from supabase_client import (get_supabase_client, get_delta_sync, get_schema, iter_batches,
+                                 clean_row, upsert_rows, reset_round_trips, round_trips, schema_problems,
+                                 sign_in, refresh_sign_in, user_client, LocalClient)
+    reset_round_trips()
+    # Shared by every session in the process; only pinged now and then, so reruns cost nothing
     supabase_client = get_supabase_client()
 except Exception:
     supabase_client = None
 
-# AI integration
-try:
-    from ai_helper import health_ai
-    ai_available = True
-except Exception:
-    ai_available = False
+def user_delta_sync(user_id=None):
+    """The user's DeltaSync, shared by their sessions and keeping rows not yet uploaded next to their tables"""
+    user_id = user_id or current_user_id()
+    return get_delta_sync(user_id, lambda table: user_path(f"{table}.pending", user_id))
+
+def data_client():
+    """Supabase client for this session: the signed-in user's view.
+
+    Returns None (local only) when nobody is signed in, since the tables only
+    admit signed-in users, or if the user's token could not be refreshed;
+    the next rerun tries again. A local SQLite client has no accounts and is
+    returned as is.
+    """
+    auth = st.session_state.get('auth')
+    if supabase_client is None:
+        return None
+    if auth is None:
+        return supabase_client if isinstance(supabase_client, LocalClient) else None
+    try:
+        fresh = refresh_sign_in(supabase_client, auth)
+    except Exception:
+        return None
+    if fresh is not auth or 'client' not in auth:
+        # Built once per token and kept with the session
+        fresh = dict(fresh, client=user_client(supabase_client, fresh))
+        st.session_state['auth'] = fresh
+    return fresh['client']
+
+# AI integration: ai_helper (requests, the provider router, optional local model)
+# is only imported once an AI feature is used, keeping it out of cold starts
+AI_PROVIDER_SETTINGS = ('HUGGINGFACE_TOKEN', 'GROQ_API_KEY', 'OPENAI_API_KEY', 'LOCAL_AI_MODEL')
+
+def ai_configured():
+    """Whether any AI provider is configured, checked without importing ai_helper"""
+    for name in AI_PROVIDER_SETTINGS:
+        if os.environ.get(name):
+            return True
+        try:
+            if st.secrets.get(name):
+                return True
+        except Exception:
+            pass
+    return False
+
+def get_health_ai():
+    """The process-wide HealthAI, importing the AI stack on first call"""
+    import ai_helper
+    return ai_helper.get_health_ai()
+
+ai_available = ai_configured()
+
+# Dashboard AI panels: title and background gradient
+AI_PANELS = {
+    'insights': ('🤖 AI Health Analysis', '#667eea 0%, #764ba2 100%'),
+    'meals': ('🍽️ AI Meal Recommendations', '#ff6b6b 0%, #ffa500 100%'),
+    'workout': ('🏃 AI Workout Suggestions', '#4ecdc4 0%, #44a08d 100%'),
+    'progress': ('📊 AI Progress Analysis', '#667eea 0%, #764ba2 100%'),
+}
+
+def render_ai_panel(container, panel, text):
+    """Draw an AI result card into a Streamlit container or placeholder"""
+    title, gradient = AI_PANELS[panel]
+    container.markdown(f"""
+    <div style="background: linear-gradient(135deg, {gradient}); 
+                border-radius: 12px; padding: 1rem; color: white; margin: 1rem 0;">
+        <h4 style="margin: 0 0 0.5rem 0;">{title}</h4>
+        <p style="margin: 0; font-size: 0.9rem;">{text}</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+def stream_ai_panel(panel, chunks, status):
+    """Grow an AI card as streamed chunks arrive, with a button to stop early.
+    
+    Clicking Stop reruns the script, which interrupts the loop below; closing
+    the generator then drops the connection to the AI service.
+    """
+    card = st.empty()
+    if isinstance(chunks, str):
+        render_ai_panel(card, panel, chunks)
+        return chunks
+    stop = st.empty()
+    card.info(f"⏳ {status}")
+    stop.button("⏹️ Stop generating", key=f"stop_{panel}")
+    text = ''
+    try:
+        for chunk in chunks:
+            text += chunk
+            render_ai_panel(card, panel, text + ' ▌')
+    finally:
+        chunks.close()
+    stop.empty()
+    render_ai_panel(card, panel, text)
+    return text
+
+# Seconds before a hydrated table is checked again for remote changes
+SUPABASE_REFRESH_TTL = 300
+
+def merge_remote_rows(table, incoming):
+    """Merge a full download from Supabase into the local table by id, returning the result"""
+    filename = f"{table}.csv"
+    local = load_data(filename)
+    if not local.empty and 'id' in local.columns:
+        local = local[~local['id'].isin(incoming['id'])]
+        incoming = pd.concat([local, incoming], ignore_index=True)
+    save_data(incoming, filename)
+    return incoming
+
+def upsert_remote_rows(table, incoming, user_id=None):
+    """Upsert rows from an incremental refresh by id, touching only their days of the rollup"""
+    user_id = user_id or current_user_id()
+    filename = f"{table}.csv"
+    days = incoming['date']
+    if table in ROLLUP_SOURCES:
+        local = load_data(filename, user_id)
+        if not local.empty:
+            # A replaced row may have moved from another day
+            days = pd.concat([days, local.loc[local['id'].isin(incoming['id']), 'date']])
+    append_rows(user_path(filename, user_id), to_records(incoming))
+    if table in ROLLUP_SOURCES:
+        rebuild_rollup_days(table, days.dropna().unique(), user_id)
+
+def hydrate_from_supabase():
+    """Load Supabase data once per session, then refresh incrementally.
+
+    The first run downloads each table in full. Afterwards a table is only
+    re-queried once its TTL has expired, and then only for rows dated on or
+    after the newest date already seen (the watermark). Pages are turned into
+    DataFrames as they arrive and merged into the local tables by id; rows
+    fetched from Supabase are marked as synced, so nothing is uploaded back.
+    Local edits not uploaded yet win over the remote copy, and after a full
+    download the local rows Supabase lacks are pushed up.
+    """
+    client = data_client()
+    if client is None:
+        return
+    user_id = current_user_id()
+    hydration = st.session_state.setdefault('supabase_hydration', {}).setdefault(user_id, {})
+    delta_sync = user_delta_sync(user_id)
+    now = datetime.now().timestamp()
+    try:
+        # Introspected once per process; tables that were never created are skipped
+        tables = get_schema(supabase_client)
+    except Exception:
+        return
+    for table in ('user_profile', 'weight_log', 'diet_log', 'workout_log'):
+        if table not in tables:
+            continue
+        state = hydration.get(table)
+        if state and now - state['refreshed_at'] < SUPABASE_REFRESH_TTL:
+            continue
+        since = state['watermark'] if state else None
+        watermark = since
+        frames, batches = [], []
+        pending = delta_sync.pending_ids(table)
+        try:
+            for batch in iter_batches(client, table, since=since):
+                # Pages arrive in ascending date order
+                watermark = max(watermark or '', str(batch[-1]['date']))
+                if pending:
+                    batch = [row for row in batch if str(row.get('id')) not in pending]
+                changed = delta_sync.diff(table, batch) if since else batch
+                if changed:
+                    # Typed page by page, so the download never holds a whole table as strings;
+                    # Supabase's own columns (user_id) are not kept locally
+                    frames.append(apply_schema(pd.DataFrame(changed).reindex(columns=TABLE_COLUMNS[table]), table))
+                batches.append(batch)
+            local = None
+            if frames:
+                remote = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+                if since:
+                    # Only the refreshed rows are written, not the whole history
+                    upsert_remote_rows(table, remote, user_id)
+                else:
+                    local = merge_remote_rows(table, remote)
+            if not since and local is None:
+                local = load_data(f"{table}.csv")
+        except Exception:
+            continue
+        remote_ids = set()
+        for batch in batches:
+            delta_sync.mark_synced(table, batch)
+            if not since:
+                remote_ids.update(str(row.get('id')) for row in batch)
+        if not since and not local.empty and 'id' in local.columns:
+            # Rows added while offline or before the first sign-in (plus any pending edits)
+            local_only = local[~local['id'].astype(str).isin(remote_ids)]
+            try:
+                delta_sync.push(client, table, to_records(local_only))
+            except Exception:
+                pass
+        hydration[table] = {'watermark': watermark, 'refreshed_at': now}
+
+# If Supabase configured, load initial data from Supabase
+if supabase_client:
+    hydrate_from_supabase()
 
 # Load data
 user_profile = load_data('user_profile.csv')
@@ -450,39 +933,20 @@ weight_log = load_data('weight_log.csv')
 diet_log = load_data('diet_log.csv')
 workout_log = load_data('workout_log.csv')
 
-# If Supabase configured, load initial data from Supabase
-if supabase_client:
+def sync_to_supabase(table, rows):
+    """Push only new or modified rows to Supabase, if configured"""
+    client = data_client()
+    if client is None:
+        return
+    delta_sync = user_delta_sync()
     try:
-        import pandas as _pd
-        sp_user = fetch_all(supabase_client, 'user_profile')
-        if sp_user:
-            user_profile = _pd.DataFrame(sp_user)
-            save_data(user_profile, 'user_profile.csv')
-            # Supabase sync
-            if supabase_client is not None:
-                try:
-                    upsert_rows(supabase_client, 'user_profile', user_profile.to_dict(orient='records'))
-                except Exception:
-                    pass
-        sp_weight = fetch_all(supabase_client, 'weight_log')
-        if sp_weight:
-            weight_log = _pd.DataFrame(sp_weight)
-            save_data(weight_log, 'weight_log.csv')
-            if supabase_client is not None:
-                try:
-                    upsert_rows(supabase_client, 'weight_log', weight_log.to_dict(orient='records'))
-                except Exception:
-                    pass
-        sp_diet = fetch_all(supabase_client, 'diet_log')
-        if sp_diet:
-            diet_log = _pd.DataFrame(sp_diet)
-            save_data(diet_log, 'diet_log.csv')
-        sp_workout = fetch_all(supabase_client, 'workout_log')
-        if sp_workout:
-            workout_log = _pd.DataFrame(sp_workout)
-            save_data(workout_log, 'workout_log.csv')
-    except Exception:
-        pass
+        delta_sync.push(client, table, rows)
+    except Exception as e:
+        # Once per outage; the rows stay queued and are retried with back-off
+        if delta_sync.failures == 1:
+            st.session_state['sync_error'] = (
+                f"Couldn't upload to Supabase ({e}). Your data is saved on this device "
+                "and will be uploaded once the connection is back.")
 
 # Helper functions
 def calculate_bmi(weight, height):
@@ -568,6 +1032,9 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
+    if 'sync_error' in st.session_state:
+        st.warning(st.session_state.pop('sync_error'))
+    
     # Create mobile-friendly tabs
     tab1, tab2, tab3, tab4 = st.tabs(["👤 Profile", "🍽️ Diet", "🏃 Workout", "📊 Dashboard"])
     
@@ -583,9 +1050,34 @@ def main():
     with tab4:
         dashboard_tab()
 
+def account_section():
+    """Sign in so data is kept in (and synced to) the user's own partition"""
+    auth = st.session_state.get('auth')
+    with st.expander("🔐 Account", expanded=auth is None):
+        if auth:
+            st.caption(f"Signed in as {auth['email']}")
+            if st.button("Sign Out"):
+                del st.session_state['auth']
+                st.rerun()
+            return
+        st.caption("Sign in to keep your data separate from other users and sync it to Supabase.")
+        with st.form("sign_in"):
+            email = st.text_input("Email")
+            password = st.text_input("Password", type="password")
+            if st.form_submit_button("Sign In"):
+                try:
+                    st.session_state['auth'] = dict(sign_in(supabase_client, email, password), email=email)
+                except Exception as e:
+                    st.error(f"Sign-in failed: {str(e)}")
+                    return
+                st.rerun()
+
 def profile_tab():
     st.header("👤 User Profile")
     
+    if supabase_client is not None:
+        account_section()
+    
     # Load current data
     current_user_profile = load_data('user_profile.csv')
     current_weight_log = load_data('weight_log.csv')
@@ -614,6 +1106,7 @@ def profile_tab():
         if st.button("Update Profile", type="primary"):
             # Save profile data
             new_profile = pd.DataFrame({
+                'id': [new_row_id()],
                 'date': [current_date],
                 'weight': [weight],
                 'height': [height],
@@ -624,11 +1117,16 @@ def profile_tab():
             
             # Update user_profile
             if not current_user_profile.empty:
-                current_user_profile.loc[0] = new_profile.iloc[0]
+                profile_columns = [c for c in new_profile.columns if c != 'id']
+                # Typed columns only accept values of their own dtype; save_data types them again
+                current_user_profile = current_user_profile.astype(
+                    {c: object for c in profile_columns if c in current_user_profile.columns})
+                current_user_profile.loc[0, profile_columns] = new_profile.iloc[0][profile_columns].values
             else:
                 current_user_profile = new_profile
             
             save_data(current_user_profile, 'user_profile.csv')
+            sync_to_supabase('user_profile', to_records(current_user_profile.iloc[[0]]))
             
             # Update weight log
             new_weight_log = pd.DataFrame({
@@ -636,14 +1134,11 @@ def profile_tab():
                 'weight': [weight]
             })
             
-            if not current_weight_log.empty and current_weight_log.iloc[-1]['date'] != current_date:
-                current_weight_log = pd.concat([current_weight_log, new_weight_log], ignore_index=True)
-            elif current_weight_log.empty:
-                current_weight_log = new_weight_log
-            else:
-                current_weight_log.iloc[-1] = new_weight_log.iloc[0]
-            
-            save_data(current_weight_log, 'weight_log.csv')
+            if not current_weight_log.empty and current_weight_log['date'].iloc[-1] == pd.Timestamp(current_date):
+                # Appended with the same id, today's entry replaces the logged one without rewriting the log
+                new_weight_log['id'] = [current_weight_log['id'].iloc[-1]]
+            changed_weights = append_data(new_weight_log.to_dict(orient='records'), 'weight_log.csv')
+            sync_to_supabase('weight_log', changed_weights)
             
             st.success("Profile updated successfully!")
             st.rerun()
@@ -699,6 +1194,7 @@ def profile_tab():
             # Weight progress chart
             if len(current_weight_log) > 1:
                 st.subheader("Weight Progress")
+                import plotly.express as px
                 fig = px.line(current_weight_log, x='date', y='weight', 
                             title="Weight Over Time", markers=True)
                 fig.update_layout(xaxis_title="Date", yaxis_title="Weight (kg)")
@@ -770,13 +1266,8 @@ def diet_tab():
                 'fat': [fat]
             })
             
-            current_diet_log = pd.concat([current_diet_log, new_meal], ignore_index=True)
-            save_data(current_diet_log, 'diet_log.csv')
-            if supabase_client is not None:
-                try:
-                    upsert_rows(supabase_client, 'diet_log', current_diet_log.to_dict(orient='records'))
-                except Exception:
-                    pass
+            new_rows = append_data(new_meal.to_dict(orient='records'), 'diet_log.csv')
+            sync_to_supabase('diet_log', new_rows)
             st.success("Meal logged successfully!")
             st.rerun()
     
@@ -784,7 +1275,7 @@ def diet_tab():
         st.subheader("Today's Summary")
         
         today = datetime.now().strftime('%Y-%m-%d')
-        today_meals = current_diet_log[current_diet_log['date'] == today] if not current_diet_log.empty else pd.DataFrame()
+        today_meals = fetch_range('diet_log', today, today)
         
         if not today_meals.empty:
             total_calories = today_meals['calories'].sum()
@@ -853,12 +1344,14 @@ def diet_tab():
         # Weekly summary
         st.subheader("Weekly Summary")
         week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        week_meals = current_diet_log[current_diet_log['date'] >= week_ago] if not current_diet_log.empty else pd.DataFrame()
+        week_days = fetch_range('daily_rollup', week_ago, today, ['date', 'calories', 'meal_count'])
+        week_meals = week_days[week_days['meal_count'] > 0] if not week_days.empty else week_days
         
         if not week_meals.empty:
-            daily_calories = week_meals.groupby('date')['calories'].sum()
+            daily_calories = week_meals.set_index('date')['calories']
             avg_daily_calories = daily_calories.mean()
             
+            import plotly.express as px
             fig = px.bar(x=daily_calories.index, y=daily_calories.values, 
                         title="Daily Calories (Last 7 Days)")
             fig.add_hline(y=tdee, line_dash="dash", line_color="red", 
@@ -901,13 +1394,8 @@ def workout_tab():
                 'calories_burned': [calories_burned]
             })
             
-            current_workout_log = pd.concat([current_workout_log, new_workout], ignore_index=True)
-            save_data(current_workout_log, 'workout_log.csv')
-            if supabase_client is not None:
-                try:
-                    upsert_rows(supabase_client, 'workout_log', current_workout_log.to_dict(orient='records'))
-                except Exception:
-                    pass
+            new_rows = append_data(new_workout.to_dict(orient='records'), 'workout_log.csv')
+            sync_to_supabase('workout_log', new_rows)
             st.success("Workout logged successfully!")
             st.rerun()
     
@@ -915,7 +1403,7 @@ def workout_tab():
         st.subheader("Today's Workouts")
         
         today = datetime.now().strftime('%Y-%m-%d')
-        today_workouts = current_workout_log[current_workout_log['date'] == today] if not current_workout_log.empty else pd.DataFrame()
+        today_workouts = fetch_range('workout_log', today, today)
         
         if not today_workouts.empty:
             total_duration = today_workouts['duration_minutes'].sum()
@@ -953,20 +1441,20 @@ def workout_tab():
         # Weekly activity summary
         st.subheader("Weekly Activity Summary")
         week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        week_workouts = current_workout_log[current_workout_log['date'] >= week_ago] if not current_workout_log.empty else pd.DataFrame()
+        week_days = fetch_range('daily_rollup', week_ago, today,
+                                ['date', 'duration_minutes', 'calories_burned', 'workout_count'])
+        week_workouts = week_days[week_days['workout_count'] > 0] if not week_days.empty else week_days
         
         if not week_workouts.empty:
-            daily_activity = week_workouts.groupby('date').agg({
-                'duration_minutes': 'sum',
-                'calories_burned': 'sum'
-            }).reset_index()
+            daily_activity = week_workouts[['date', 'duration_minutes', 'calories_burned']]
             
+            import plotly.express as px
             fig = px.bar(daily_activity, x='date', y='duration_minutes', 
                         title="Daily Workout Duration (Last 7 Days)")
             st.plotly_chart(fig, use_container_width=True)
             
-            st.metric("Weekly Total", f"{daily_activity['duration_minutes'].sum()} min", 
-                     f"{daily_activity['calories_burned'].sum()} cal burned")
+            st.metric("Weekly Total", f"{int(daily_activity['duration_minutes'].sum())} min", 
+                     f"{int(daily_activity['calories_burned'].sum())} cal burned")
         else:
             st.info("No workouts logged this week")
 
@@ -993,14 +1481,13 @@ def dashboard_tab():
     tdee = calculate_tdee(bmr, current_profile['activity_level'])
     
     # Today's data
-    today_meals = current_diet_log[current_diet_log['date'] == today] if not current_diet_log.empty else pd.DataFrame()
-    today_workouts = current_workout_log[current_workout_log['date'] == today] if not current_workout_log.empty else pd.DataFrame()
+    today_totals = fetch_range('daily_rollup', today, today)
     
     # Mobile-friendly summary cards
-    calories_consumed = today_meals['calories'].sum() if not today_meals.empty else 0
-    calories_burned = today_workouts['calories_burned'].sum() if not today_workouts.empty else 0
+    calories_consumed = today_totals['calories'].sum() if not today_totals.empty else 0
+    calories_burned = today_totals['calories_burned'].sum() if not today_totals.empty else 0
     net_calories = calories_consumed - calories_burned
-    workout_time = today_workouts['duration_minutes'].sum() if not today_workouts.empty else 0
+    workout_time = int(today_totals['duration_minutes'].sum()) if not today_totals.empty else 0
     
     # Create mobile-friendly dashboard cards
     st.markdown("### 📊 Today's Overview")
@@ -1052,6 +1539,7 @@ def dashboard_tab():
         # Weight progress
         if len(current_weight_log) > 1:
             st.write("**Weight Progress**")
+            import plotly.express as px
             fig = px.line(current_weight_log, x='date', y='weight', 
                          title="Weight Over Time", markers=True)
             fig.update_layout(xaxis_title="Date", yaxis_title="Weight (kg)")
@@ -1064,31 +1552,11 @@ def dashboard_tab():
         if not current_diet_log.empty and not current_workout_log.empty:
             st.write("**Calorie Balance Over Time**")
             
-            # Get last 7 days
-            week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-            recent_diet = current_diet_log[current_diet_log['date'] >= week_ago]
-            recent_workouts = current_workout_log[current_workout_log['date'] >= week_ago]
+            window_label = st.selectbox("Window", list(BALANCE_WINDOWS), key="balance_window")
+            balance_df = calorie_balance(load_data(ROLLUP_FILE), today, BALANCE_WINDOWS[window_label])
             
-            if not recent_diet.empty and not recent_workouts.empty:
-                daily_calories = recent_diet.groupby('date')['calories'].sum()
-                daily_burned = recent_workouts.groupby('date')['calories_burned'].sum()
-                
-                # Combine data
-                all_dates = set(daily_calories.index) | set(daily_burned.index)
-                balance_data = []
-                
-                for date in sorted(all_dates):
-                    consumed = daily_calories.get(date, 0)
-                    burned = daily_burned.get(date, 0)
-                    balance_data.append({
-                        'date': date,
-                        'consumed': consumed,
-                        'burned': burned,
-                        'net': consumed - burned
-                    })
-                
-                balance_df = pd.DataFrame(balance_data)
-                
+            if not balance_df.empty:
+                import plotly.graph_objects as go
                 fig = go.Figure()
                 fig.add_trace(go.Scatter(x=balance_df['date'], y=balance_df['consumed'], 
                                        name='Calories Consumed', line=dict(color='blue')))
@@ -1105,31 +1573,54 @@ def dashboard_tab():
     # Data Management Section
     st.subheader("💾 Data Management")
     
+    cache = table_cache.stats()
+    st.caption(f"Data cache (shared by all sessions): {cache['tables']} tables, "
+               f"{cache['bytes'] / 2**20:.1f} of {cache['max_bytes'] / 2**20:.0f} MB, "
+               f"{cache['hit_rate']:.0%} hit rate ({cache['hits']} hits, {cache['misses']} misses, "
+               f"{cache['evictions']} evictions)")
+    if supabase_client is not None:
+        st.caption(f"Supabase round-trips this run: {round_trips()}")
+        try:
+            problems = schema_problems(supabase_client)
+        except Exception:
+            problems = []
+        if problems:
+            st.warning("Supabase schema differs from SUPABASE_SCHEMA.sql: " + "; ".join(problems))
+    
     col_data1, col_data2 = st.columns(2)
     
     with col_data1:
         st.markdown("**Export Your Data**")
         st.markdown("Download all your health data as a backup file.")
         
-        if st.button("📥 Export Data", type="secondary"):
-            zip_data = export_data()
-            st.download_button(
-                label="Download Health Data",
-                data=zip_data,
-                file_name=f"health_data_{datetime.now().strftime('%Y%m%d')}.zip",
-                mime="application/zip"
-            )
-            st.success("Data exported successfully!")
+        formats = ["CSV", "Parquet"] if importlib.util.find_spec('pyarrow') else ["CSV"]
+        export_format = st.radio("Format", formats, horizontal=True, key="export_format")
+        differential = st.checkbox("Only rows changed since the last backup", key="export_differential")
+        user_id = current_user_id()
+        # Copy-on-write views of the cached tables; the archive is only built when the button is clicked
+        tables = {filename: load_data(filename, user_id) for filename in EXPORT_FILES}
+        suffix = "_changes" if differential else ""
+        st.download_button(
+            label="📥 Export Data",
+            data=functools.partial(export_data, tables, user_path(BACKUP_MANIFEST, user_id),
+                                   columnar=export_format == "Parquet", differential=differential),
+            file_name=f"health_data_{datetime.now().strftime('%Y%m%d')}{suffix}.zip",
+            mime="application/zip",
+            on_click="ignore"
+        )
     
     with col_data2:
         st.markdown("**Import Your Data**")
         st.markdown("Upload a previously exported data file.")
         
+        if 'import_summary' in st.session_state:
+            st.success(st.session_state.pop('import_summary'))
         uploaded_file = st.file_uploader("Choose a ZIP file", type="zip", key="data_import")
         if uploaded_file is not None:
+            # Only offered when there is somewhere to upload to, i.e. once signed in
+            upload = data_client() is not None and st.checkbox("Also upload the imported rows to Supabase")
             if st.button("📤 Import Data", type="secondary"):
-                if import_data(uploaded_file):
-                    st.success("Data imported successfully!")
+                if import_data(uploaded_file, upload=upload):
                     st.rerun()
                 else:
                     st.error("Failed to import data. Please check the file format.")
@@ -1140,69 +1631,68 @@ def dashboard_tab():
     st.subheader("🤖 AI Health Assistant")
     
     if ai_available:
+        user_data = {
+            'weight': current_profile['weight'],
+            'height': current_profile['height'],
+            'age': current_profile['age'],
+            'gender': current_profile['gender'],
+            'activity_level': current_profile['activity_level'],
+            'bmi': bmi,
+            'daily_calories': calories_consumed,
+            'workout_time': workout_time
+        }
+        has_progress = len(current_weight_log) > 1 or len(current_diet_log) > 0 or len(current_workout_log) > 0
+        
+        # Generate every panel at once; each card fills in as its call finishes
+        if st.button("✨ Generate All AI Insights", type="primary"):
+            progress = (current_weight_log, current_diet_log, current_workout_log) if has_progress else None
+            panels = [panel for panel in AI_PANELS if panel != 'progress' or has_progress]
+            placeholders = {panel: st.empty() for panel in panels}
+            for panel in panels:
+                placeholders[panel].info(f"⏳ {AI_PANELS[panel][0]} is being generated...")
+            for panel, text in get_health_ai().generate_panels(user_data, current_profile, progress=progress):
+                render_ai_panel(placeholders[panel], panel, text)
+        
         # AI Health Insights
-        if st.button("🧠 Get AI Health Insights", type="primary"):
-            with st.spinner("AI is analyzing your health data..."):
-                user_data = {
-                    'weight': current_profile['weight'],
-                    'height': current_profile['height'],
-                    'age': current_profile['age'],
-                    'gender': current_profile['gender'],
-                    'activity_level': current_profile['activity_level'],
-                    'bmi': bmi,
-                    'daily_calories': calories_consumed,
-                    'workout_time': workout_time
-                }
-                
-                ai_insights = health_ai.get_health_insights(user_data)
-                st.markdown(f"""
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                            border-radius: 12px; padding: 1rem; color: white; margin: 1rem 0;">
-                    <h4 style="margin: 0 0 0.5rem 0;">🤖 AI Health Analysis</h4>
-                    <p style="margin: 0; font-size: 0.9rem;">{ai_insights}</p>
-                </div>
-                """, unsafe_allow_html=True)
+        if st.button("🧠 Get AI Health Insights", type="secondary"):
+            stream_ai_panel('insights', get_health_ai().get_health_insights(user_data, stream=True),
+                            "AI is analyzing your health data...")
         
         # AI Meal Recommendations
         if st.button("🍽️ Get AI Meal Suggestions", type="secondary"):
-            with st.spinner("AI is suggesting meals..."):
-                meal_suggestions = health_ai.get_meal_recommendations(current_profile, "healthy meal")
-                st.markdown(f"""
-                <div style="background: linear-gradient(135deg, #ff6b6b 0%, #ffa500 100%); 
-                            border-radius: 12px; padding: 1rem; color: white; margin: 1rem 0;">
-                    <h4 style="margin: 0 0 0.5rem 0;">🍽️ AI Meal Recommendations</h4>
-                    <p style="margin: 0; font-size: 0.9rem;">{meal_suggestions}</p>
-                </div>
-                """, unsafe_allow_html=True)
+            stream_ai_panel('meals', get_health_ai().get_meal_recommendations(current_profile, "healthy meal", stream=True),
+                            "AI is suggesting meals...")
         
         # AI Workout Suggestions
         if st.button("🏃 Get AI Workout Plan", type="secondary"):
-            with st.spinner("AI is creating a workout plan..."):
-                workout_suggestions = health_ai.get_workout_suggestions(current_profile, 30)
-                st.markdown(f"""
-                <div style="background: linear-gradient(135deg, #4ecdc4 0%, #44a08d 100%); 
-                            border-radius: 12px; padding: 1rem; color: white; margin: 1rem 0;">
-                    <h4 style="margin: 0 0 0.5rem 0;">🏃 AI Workout Suggestions</h4>
-                    <p style="margin: 0; font-size: 0.9rem;">{workout_suggestions}</p>
-                </div>
-                """, unsafe_allow_html=True)
+            stream_ai_panel('workout', get_health_ai().get_workout_suggestions(current_profile, 30, stream=True),
+                            "AI is creating a workout plan...")
         
         # AI Progress Analysis
-        if len(weight_log) > 1 or len(diet_log) > 0 or len(workout_log) > 0:
+        if has_progress:
             if st.button("📊 Get AI Progress Analysis", type="secondary"):
-                with st.spinner("AI is analyzing your progress..."):
-                    weight_data = weight_log.to_dict('records') if not weight_log.empty else []
-                    diet_data = diet_log.to_dict('records') if not diet_log.empty else []
-                    workout_data = workout_log.to_dict('records') if not workout_log.empty else []
-                    
-                    progress_analysis = health_ai.analyze_progress(weight_data, diet_data, workout_data)
-                    st.markdown(f"""
-                    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                                border-radius: 12px; padding: 1rem; color: white; margin: 1rem 0;">
-                        <h4 style="margin: 0 0 0.5rem 0;">📊 AI Progress Analysis</h4>
-                        <p style="margin: 0; font-size: 0.9rem;">{progress_analysis}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                stream_ai_panel('progress', get_health_ai().analyze_progress(current_weight_log, current_diet_log,
+                                                                            current_workout_log, stream=True),
+                                "AI is analyzing your progress...")
+
+        # Stats only exist once the AI stack has been loaded by this process
+        if 'ai_helper' in sys.modules:
+            health_ai = get_health_ai()
+            cache_stats = health_ai.cache_stats()
+            coalescing = health_ai.coalescing_stats()
+            st.caption(f"AI response cache: {cache_stats['size']} entries, "
+                       f"{cache_stats['hit_rate']:.0%} hit rate ({cache_stats['hits']} hits, {cache_stats['misses']} misses); "
+                       f"{coalescing['single_flight']['shared']} requests shared an in-flight call, "
+                       f"{coalescing['hf_batches']['mean_batch_size']:.1f} prompts per upstream batch")
+            provider_notes = []
+            for name, stats in health_ai.provider_stats().items():
+                if stats['circuit_open']:
+                    provider_notes.append(f"{name} paused after errors")
+                elif stats['p50'] is not None:
+                    provider_notes.append(f"{name} p50 {stats['p50']:.1f}s / p95 {stats['p95']:.1f}s, "
+                                          f"{stats['error_rate']:.0%} errors")
+            if provider_notes:
+                st.caption("AI providers: " + "; ".join(provider_notes))
     else:
         st.info("🤖 AI features not available. Configure Hugging Face token to enable AI assistance.")
     
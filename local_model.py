@@ -0,0 +1,151 @@
+"""In-process text generation with a small seq2seq model on CPU.
+
+Optional: needs the ``transformers`` and ``torch`` packages and the model
+weights in the Hugging Face cache (set ``HF_HUB_OFFLINE=1`` to never touch
+the network). The model loads on first use and is shared by every session
+in the process. Prompts that arrive within ``batch_window`` seconds of each
+other are generated together as one padded batch.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+DEFAULT_MODEL = "google/flan-t5-base"
+# Encoder inputs beyond this are truncated; flan-t5 was trained on 512 tokens
+MAX_INPUT_TOKENS = 512
+
+
+class _RowTemperature:
+    """Logits processor applying a separate sampling temperature to each batch row"""
+
+    def __init__(self, temperatures):
+        self.temperatures = temperatures
+
+    def __call__(self, input_ids, scores):
+        return scores / self.temperatures
+
+
+class LocalGenerator:
+    """Lazily loaded seq2seq model with micro-batching of concurrent prompts"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, batch_window: float = 0.02,
+                 max_batch_size: int = 8, threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.threads = threads
+        self.batches = 0
+        self.prompts = 0
+        self._queue = queue.Queue()
+        self._load_lock = threading.Lock()
+        self._model = None
+        self._tokenizer = None
+        self._torch = None
+        self._processor_list = None
+
+    def _load(self) -> None:
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            try:
+                import torch
+                from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, LogitsProcessorList
+            except ImportError as e:
+                raise ImportError("Local AI needs the transformers and torch packages "
+                                  "(pip install transformers torch)") from e
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+            model.eval()
+            self._torch = torch
+            self._processor_list = LogitsProcessorList
+            self._model = model
+            threading.Thread(target=self._run, name="local-ai", daemon=True).start()
+
+    def generate(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7,
+                 timeout: Optional[float] = None) -> str:
+        """Generate text for one prompt, batched with any others in flight"""
+        self._load()
+        future = Future()
+        self._queue.put((prompt, max_new_tokens, temperature, future))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Callers that timed out no longer need an answer
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                texts = self._generate_batch(
+                    [item[0] for item in batch],
+                    [item[1] for item in batch],
+                    [item[2] for item in batch],
+                )
+            except Exception as e:
+                for item in batch:
+                    item[3].set_exception(e)
+            else:
+                for item, text in zip(batch, texts):
+                    item[3].set_result(text)
+
+    def _generate_batch(self, prompts: List[str], max_new_tokens: List[int],
+                        temperatures: List[float]) -> List[str]:
+        torch = self._torch
+        inputs = self._tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                 max_length=MAX_INPUT_TOKENS)
+        # One generate call serves every row: run to the longest limit and trim each row to its own,
+        # and sample with per-row temperatures (near zero approximates greedy decoding)
+        row_temperatures = torch.tensor([max(t, 1e-4) for t in temperatures]).unsqueeze(1)
+        with torch.inference_mode():
+            output = self._model.generate(
+                **inputs,
+                max_new_tokens=max(max_new_tokens),
+                do_sample=True,
+                logits_processor=self._processor_list([_RowTemperature(row_temperatures)]),
+            )
+        self.batches += 1
+        self.prompts += len(prompts)
+        # Decoder output starts with the decoder start token
+        rows = [row[:1 + limit] for row, limit in zip(output, max_new_tokens)]
+        return self._tokenizer.batch_decode(rows, skip_special_tokens=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "loaded": self._model is not None,
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "mean_batch_size": self.prompts / self.batches if self.batches else 0.0,
+        }
+
+
+_generators: Dict[str, LocalGenerator] = {}
+_generators_lock = threading.Lock()
+
+
+def get_local_generator(model_name: str = DEFAULT_MODEL, **options) -> LocalGenerator:
+    """Process-wide generator for ``model_name``; the weights load on first generate()"""
+    with _generators_lock:
+        generator = _generators.get(model_name)
+        if generator is None:
+            generator = _generators[model_name] = LocalGenerator(model_name, **options)
+        return generator
@@ -0,0 +1,80 @@
+"""Import-time report for a cold start of the Streamlit app.
+
+Runs ``app.py`` once through Streamlit's AppTest in a fresh interpreter with
+``python -X importtime``, using an empty temporary data directory and no
+Supabase settings. Prints the slowest top-level imports and exits non-zero if
+a module that is meant to load lazily was imported on that first render::
+
+    python profile_imports.py [--top 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+# Only needed once a chart is drawn, Supabase is configured or an AI feature is used.
+# (Streamlit itself imports plotly.graph_objects, so only plotly.express is listed.)
+LAZY_MODULES = ('plotly.express', 'supabase', 'postgrest', 'ai_helper', 'ai_router', 'local_model',
+                'transformers', 'torch')
+UNSET_SETTINGS = ('SUPABASE_URL', 'SUPABASE_ANON_KEY')
+
+RUNNER = """
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120).run()
+if at.exception:
+    raise SystemExit(at.exception[0].message)
+"""
+
+
+def profile(app_path=APP_PATH):
+    """(module, self_us, cumulative_us, depth) for every import of one app run"""
+    env = {k: v for k, v in os.environ.items() if k not in UNSET_SETTINGS}
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', RUNNER.format(app=app_path)],
+            cwd=workdir, env=env, capture_output=True, text=True,
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"app run failed:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def eager_imports(imports):
+    """Modules from ``LAZY_MODULES`` (or their submodules) among ``profile()``'s imports"""
+    return sorted({name for name, *_ in imports
+                   if any(name == lazy or name.startswith(lazy + '.') for lazy in LAZY_MODULES)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=20, help='number of slowest imports to list')
+    args = parser.parse_args()
+
+    imports = profile()
+    top_level = sorted((i for i in imports if i[3] == 0), key=lambda i: i[2], reverse=True)
+    total = sum(i[2] for i in top_level)
+    print(f"{len(imports)} modules imported, {total / 1e6:.2f} s cumulative at top level\n")
+    print(f"{'cumulative ms':>14}  module")
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f}  {name}")
+
+    eager = eager_imports(imports)
+    if eager:
+        print("\nImported on the first render but meant to load lazily:")
+        for name in eager:
+            print(f"  {name}")
+        sys.exit(1)
+    print("\nNo lazily loaded modules were imported on the first render.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,959 @@
+"""Local file storage for the health logs.
+
+Tables are addressed by their historical CSV name (``diet_log.csv``) and
+stored by a pluggable backend selected with the ``HEALTH_STORAGE_FORMAT``
+environment variable: plain CSV, a typed columnar file (Parquet or Feather),
+or an embedded SQLite database. The other backends migrate an existing CSV
+the first time it is read.
+
+Each table is a base file plus an append-only journal next to it
+(``diet_log.parquet`` + ``diet_log.parquet.journal``). Logging an entry only
+appends to the journal; a background compaction folds the journal back into
+the base file once it grows past ``COMPACT_THRESHOLD_BYTES``.
+
+With several users, each has the same set of tables in a directory of their
+own (``user_path``).
+"""
+import io
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+JOURNAL_SUFFIX = '.journal'
+COMPACT_THRESHOLD_BYTES = 256 * 1024
+# Per-user partitions, one directory each (see ``user_path``)
+USERS_DIR = 'users'
+_USER_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+# Memory budget of the process-wide table cache
+CACHE_MAX_BYTES = int(float(os.environ.get('HEALTH_CACHE_MB', '256')) * 1024 * 1024)
+
+# Sessions are handed shallow copies of shared cached frames; with Copy-on-Write
+# (always on from pandas 3) an edit in one session copies instead of leaking into the cache
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+_locks = {}
+_locks_guard = threading.Lock()
+_compacting = set()
+
+
+def _lock_for(filename):
+    """Return the lock serialising writers of one table file"""
+    with _locks_guard:
+        return _locks.setdefault(os.path.abspath(filename), threading.RLock())
+
+
+def table_lock(filename):
+    """The (re-entrant) lock every write to a table takes.
+
+    Hold it around a read-modify-write of the table so that a write from
+    another session cannot land in between.
+    """
+    return _lock_for(filename)
+
+
+# In-memory dtypes of every table (see ``apply_schema``). Ids and food names stay strings.
+# Body weight and height stay float64: they are few rows, and go into the BMI and ideal
+# weight formulas and AI prompts, where float32 would show as 24.200000762939453.
+DATE_DTYPE = 'datetime64[ns]'
+TABLE_SCHEMA = {
+    'user_profile': {'date': DATE_DTYPE, 'weight': 'float64', 'height': 'float64', 'age': 'int16',
+                     'gender': 'category', 'activity_level': 'category'},
+    'weight_log': {'date': DATE_DTYPE, 'weight': 'float64'},
+    'diet_log': {'date': DATE_DTYPE, 'meal_type': 'category', 'calories': 'float32', 'protein': 'float32',
+                 'carbs': 'float32', 'fat': 'float32'},
+    'workout_log': {'date': DATE_DTYPE, 'exercise_name': 'category', 'duration_minutes': 'int16',
+                    'calories_burned': 'float32'},
+    'daily_rollup': {'date': DATE_DTYPE, 'calories': 'float32', 'protein': 'float32', 'carbs': 'float32',
+                     'fat': 'float32', 'meal_count': 'int16', 'calories_burned': 'float32',
+                     'duration_minutes': 'float32', 'workout_count': 'int16'},
+}
+_INT16 = np.iinfo(np.int16)
+
+
+def _table_name(path):
+    return os.path.basename(path).split('.')[0]
+
+
+class CsvBackend:
+    """Plain CSV files; types are re-inferred on every read"""
+
+    suffix = '.csv'
+
+    def read(self, path):
+        return pd.read_csv(path)
+
+    def write(self, data, path):
+        _fsync_write(path, data.to_csv(index=False).encode('utf-8'), 'w')
+
+
+class ColumnarBackend:
+    """Typed columnar files storing each table with its ``TABLE_SCHEMA`` dtypes"""
+
+    suffix = None
+
+    def _read_file(self, path):
+        raise NotImplementedError
+
+    def _write_file(self, data, path):
+        raise NotImplementedError
+
+    def read(self, path):
+        return self._read_file(path)
+
+    def write(self, data, path):
+        self._write_file(apply_schema(data, _table_name(path)), path)
+        with open(path, 'rb+') as f:
+            os.fsync(f.fileno())
+
+
+class ParquetBackend(ColumnarBackend):
+    suffix = '.parquet'
+
+    def _read_file(self, path):
+        return pd.read_parquet(path)
+
+    def _write_file(self, data, path):
+        data.to_parquet(path, index=False)
+
+
+class FeatherBackend(ColumnarBackend):
+    suffix = '.feather'
+
+    def _read_file(self, path):
+        return pd.read_feather(path)
+
+    def _write_file(self, data, path):
+        data.reset_index(drop=True).to_feather(path)
+
+
+# Local mirror of SUPABASE_SCHEMA.sql (uuid -> TEXT, date -> ISO TEXT, numeric -> REAL)
+SQLITE_SCHEMA = """
+create table if not exists user_profile (
+    id text primary key,
+    date text not null,
+    weight real,
+    height real,
+    age integer,
+    gender text,
+    activity_level text
+);
+
+create table if not exists weight_log (
+    id text primary key,
+    date text not null,
+    weight real
+);
+
+create table if not exists diet_log (
+    id text primary key,
+    date text not null,
+    meal_type text,
+    food_name text,
+    calories real,
+    protein real,
+    carbs real,
+    fat real
+);
+
+create table if not exists workout_log (
+    id text primary key,
+    date text not null,
+    exercise_name text,
+    duration_minutes integer,
+    calories_burned real
+);
+
+create index if not exists user_profile_date_idx on user_profile (date);
+create index if not exists weight_log_date_idx on weight_log (date);
+create index if not exists diet_log_date_idx on diet_log (date);
+-- Nothing filters by meal type; the date index serves every range query
+drop index if exists diet_log_date_meal_type_idx;
+create index if not exists workout_log_date_idx on workout_log (date);
+
+create table if not exists daily_rollup (
+    date text primary key,
+    calories real not null default 0,
+    protein real not null default 0,
+    carbs real not null default 0,
+    fat real not null default 0,
+    meal_count integer not null default 0,
+    calories_burned real not null default 0,
+    duration_minutes real not null default 0,
+    workout_count integer not null default 0
+);
+
+create table if not exists storage_meta (
+    key text primary key,
+    value text
+);
+"""
+
+TABLE_COLUMNS = {
+    'user_profile': ['date', 'weight', 'height', 'age', 'gender', 'activity_level', 'id'],
+    'weight_log': ['date', 'weight', 'id'],
+    'diet_log': ['date', 'meal_type', 'food_name', 'calories', 'protein', 'carbs', 'fat', 'id'],
+    'workout_log': ['date', 'exercise_name', 'duration_minutes', 'calories_burned', 'id'],
+    'daily_rollup': ['date', 'calories', 'protein', 'carbs', 'fat', 'meal_count',
+                     'calories_burned', 'duration_minutes', 'workout_count'],
+}
+
+
+def _column_dtype(values, dtype):
+    """The dtype ``values`` should be cast to, or None if it already has it"""
+    if dtype == 'category':
+        return None if isinstance(values.dtype, pd.CategoricalDtype) else dtype
+    if dtype == 'int16' and values.dtype == 'float32':
+        # Counts with gaps (or out of int16 range) are kept as float32
+        return None
+    return None if values.dtype == dtype else dtype
+
+
+def apply_schema(data, table):
+    """Cast a table's columns to their ``TABLE_SCHEMA`` dtypes.
+
+    Dates become datetime64 (unparseable ones NaT), logged measurements
+    float32, counts int16 and repeated labels categorical. Columns that already have
+    their dtype are left alone, so a typed frame is returned as it is.
+    """
+    schema = TABLE_SCHEMA.get(table)
+    if data is None or not schema:
+        return data
+    typed = None
+    for column, dtype in schema.items():
+        if column not in data.columns:
+            continue
+        values = data[column]
+        dtype = _column_dtype(values, dtype)
+        if dtype is None:
+            continue
+        if dtype == DATE_DTYPE:
+            values = pd.to_datetime(values, format='ISO8601', errors='coerce').astype(DATE_DTYPE)
+        elif dtype == 'category':
+            values = values.astype('category')
+        else:
+            values = pd.to_numeric(values, errors='coerce')
+            if dtype == 'int16' and not (values.notna().all() and values.between(_INT16.min, _INT16.max).all()
+                                         and (values == values.round()).all()):
+                dtype = 'float32'
+            values = values.astype(dtype)
+        if typed is None:
+            typed = data.copy(deep=False)
+        typed[column] = values
+    return data if typed is None else typed
+
+
+def to_records(data):
+    """Rows as dicts for JSON APIs, with float32 values widened by their shortest repr (70.1, not 70.09999847)"""
+    wide = data.copy(deep=False)
+    for column in data.columns:
+        if data[column].dtype == 'float32':
+            wide[column] = data[column].astype(str).astype('float64')
+    return wide.to_dict(orient='records')
+
+
+def _sql_rows(data, columns):
+    """Turn a frame into parameter tuples for ``executemany``"""
+    frame = data.reindex(columns=columns)
+    if 'date' in frame.columns and pd.api.types.is_datetime64_any_dtype(frame['date']):
+        frame['date'] = frame['date'].dt.strftime('%Y-%m-%d')
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.itertuples(index=False, name=None)
+
+
+class SQLiteBackend:
+    """Embedded SQLite database mirroring the Supabase schema.
+
+    Rows are stored individually, so appends are single indexed inserts and
+    date-range queries use the ``date`` indexes. The database runs in WAL mode
+    so readers in other sessions never block a writer. Each thread gets its
+    own connection.
+    """
+
+    suffix = None
+
+    def __init__(self, path='health.db'):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('pragma journal_mode=wal')
+            conn.execute('pragma synchronous=normal')
+            conn.executescript(SQLITE_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def has_table(self, table):
+        row = self.connect().execute(
+            'select 1 from storage_meta where key = ?', (f"initialised:{table}",)).fetchone()
+        return row is not None
+
+    def _mark_initialised(self, conn, table):
+        conn.execute('insert or ignore into storage_meta (key, value) values (?, ?)',
+                     (f"initialised:{table}", '1'))
+
+    def _insert(self, conn, table, data):
+        columns = TABLE_COLUMNS[table]
+        statement = (f"insert or replace into {table} ({', '.join(columns)}) "
+                     f"values ({', '.join('?' for _ in columns)})")
+        if 'id' in columns:
+            ensure_row_ids(data)
+        conn.executemany(statement, _sql_rows(data, columns))
+
+    def read_table(self, table, columns=None):
+        columns = list(columns) if columns is not None else TABLE_COLUMNS[table]
+        return pd.read_sql_query(
+            f"select {', '.join(columns)} from {table} order by date, rowid", self.connect())
+
+    def write_table(self, data, table):
+        conn = self.connect()
+        with conn:
+            conn.execute(f"delete from {table}")
+            self._insert(conn, table, data)
+            self._mark_initialised(conn, table)
+
+    def write_frames(self, frames, table):
+        """Replace a table with a stream of frames in one transaction"""
+        conn = self.connect()
+        with conn:
+            conn.execute(f"delete from {table}")
+            for frame in frames:
+                self._insert(conn, table, frame)
+            self._mark_initialised(conn, table)
+
+    def append_rows(self, table, rows):
+        conn = self.connect()
+        with conn:
+            self._insert(conn, table, pd.DataFrame(rows))
+            self._mark_initialised(conn, table)
+
+    def fetch_range(self, table, start, end, columns=None):
+        """Rows with ``start <= date <= end``, served by the date index"""
+        columns = list(columns) if columns is not None else TABLE_COLUMNS[table]
+        data = pd.read_sql_query(
+            f"select {', '.join(columns)} from {table} where date between ? and ? order by date, rowid",
+            self.connect(), params=(start, end))
+        return apply_schema(data, table)
+
+
+BACKENDS = {
+    'csv': CsvBackend,
+    'parquet': ParquetBackend,
+    'feather': FeatherBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def _default_format():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'csv'
+    return 'parquet'
+
+
+_backend = None
+_databases = {}
+
+
+def get_backend():
+    """Return the configured storage backend (Parquet when pyarrow is available)"""
+    global _backend
+    if _backend is None:
+        name = os.environ.get('HEALTH_STORAGE_FORMAT', '').lower() or _default_format()
+        _backend = BACKENDS.get(name, CsvBackend)()
+    return _backend
+
+
+def set_backend(backend):
+    """Switch the storage backend, e.g. ``set_backend(BACKENDS['csv']())``"""
+    global _backend
+    _backend = backend
+    _databases.clear()
+
+
+def _base_path(filename):
+    return os.path.splitext(filename)[0] + get_backend().suffix
+
+
+def _journal_path(filename):
+    return _base_path(filename) + JOURNAL_SUFFIX
+
+
+def _fsync_write(path, payload, mode):
+    """Write bytes with a single write call and flush them to disk"""
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if mode == 'a' else os.O_TRUNC)
+    fd = os.open(path, flags, 0o644)
+    try:
+        os.write(fd, payload)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_journal(path):
+    """Read a journal, ignoring a torn last line left by an interrupted append"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    end = raw.rfind(b'\n')
+    if end < 0:
+        return pd.DataFrame()
+    return pd.read_csv(io.BytesIO(raw[:end + 1]))
+
+
+def _repair_tail(path):
+    """Drop a torn last line so the next append starts on a fresh line"""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        f.seek(0)
+        raw = f.read()
+        f.truncate(raw.rfind(b'\n') + 1)
+
+
+def _journal_header(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+
+def _row_key(table):
+    """The column a table's rows are upserted by: the day for the rollup, else the row id"""
+    return 'date' if table == 'daily_rollup' else 'id'
+
+
+def _merge(frames, key='id'):
+    """Concatenate base and journal frames, keeping the last row for each ``key``"""
+    non_empty = [f for f in frames if not f.empty]
+    if not non_empty:
+        return frames[0] if frames else pd.DataFrame()
+    if len(non_empty) == 1:
+        data = non_empty[0]
+    else:
+        data = pd.concat(non_empty, ignore_index=True)
+    columns = list(dict.fromkeys(c for f in frames for c in f.columns))
+    data = data.reindex(columns=columns)
+    if key in data.columns:
+        # A crash between replacing the base file and clearing the journal
+        # leaves the journal rows in both, and an upsert journals a newer copy
+        # of a row (possibly more than once); keeping the last row per key
+        # handles both.
+        keys = data[key]
+        if key == 'date':
+            # Typed in the base file, still text in the journal
+            keys = pd.to_datetime(keys, format='ISO8601', errors='coerce')
+        replayed = keys.notna() & keys.duplicated(keep='last')
+        if replayed.any():
+            data = data[~replayed].reset_index(drop=True)
+    return data
+
+
+def new_row_id():
+    """Generate a row id compatible with the Supabase ``uuid`` primary keys"""
+    return str(uuid.uuid4())
+
+
+def ensure_row_ids(data):
+    """Give legacy rows written before ids existed one; returns True if any were added"""
+    if data.empty:
+        return False
+    if 'id' not in data.columns:
+        data['id'] = None
+    missing = data['id'].isna()
+    if not missing.any():
+        return False
+    data['id'] = data['id'].astype(object)
+    data.loc[missing, 'id'] = [new_row_id() for _ in range(int(missing.sum()))]
+    return True
+
+
+ROLLUP_COLUMNS = TABLE_COLUMNS['daily_rollup']
+
+# Rollup column -> source column for each log; None counts rows
+ROLLUP_SOURCES = {
+    'diet_log': {'calories': 'calories', 'protein': 'protein', 'carbs': 'carbs', 'fat': 'fat',
+                 'meal_count': None},
+    'workout_log': {'calories_burned': 'calories_burned', 'duration_minutes': 'duration_minutes',
+                    'workout_count': None},
+}
+
+
+def daily_totals(table, data):
+    """Per-day rollup columns contributed by the given rows of one log"""
+    spec = ROLLUP_SOURCES[table]
+    if data.empty or 'date' not in data.columns:
+        return pd.DataFrame(columns=list(spec), index=pd.Index([], name='date'), dtype='float64')
+    frame = pd.DataFrame({
+        target: pd.to_numeric(data[source], errors='coerce').to_numpy() if source else 1
+        for target, source in spec.items()
+    }, index=pd.Index(data['date'].to_numpy(), name='date'))
+    return frame.groupby(level=0).sum()
+
+
+def apply_rollup(rollup, table, rows, replace=False):
+    """Add one log's rows to the daily rollup.
+
+    With ``replace=True`` the log's previous contribution is discarded first,
+    which rebuilds its columns from a full copy of the log. Only the days
+    touched by ``rows`` are changed otherwise.
+    """
+    columns = list(ROLLUP_SOURCES[table])
+    totals = daily_totals(table, rows)
+    current = rollup.set_index('date') if not rollup.empty else pd.DataFrame(index=pd.Index([], name='date'))
+    # Summed in float64; the caller's save re-applies the float32/int16 schema
+    current = current.reindex(columns=ROLLUP_COLUMNS[1:], fill_value=0).astype('float64')
+    if replace:
+        current[columns] = 0.0
+    current = current.reindex(current.index.union(totals.index), fill_value=0)
+    current.loc[totals.index, columns] = current.loc[totals.index, columns].to_numpy() + totals[columns].to_numpy()
+    current = current[(current[['meal_count', 'workout_count']] > 0).any(axis=1)]
+    return current.sort_index().rename_axis('date').reset_index()
+
+
+def sort_by_date(data):
+    """Keep a log ordered by date so range lookups can binary search it"""
+    if data.empty or 'date' not in data.columns:
+        return data
+    if pd.api.types.is_string_dtype(data['date']) and data['date'].dtype != object:
+        # Arrow-backed strings convert to numpy on every searchsorted call
+        data['date'] = data['date'].astype(object)
+    if data['date'].is_monotonic_increasing:
+        return data
+    return data.sort_values('date', kind='stable', ignore_index=True)
+
+
+def select_date_range(data, start, end, columns=None):
+    """Rows with ``start <= date <= end`` from a date-sorted table.
+
+    Uses binary search on the date column, so the cost is O(log n + window)
+    rather than a scan of the whole history.
+    """
+    if data.empty or 'date' not in data.columns:
+        return data
+    dates = data['date'].values
+    if dates.dtype.kind == 'M':
+        start, end = np.datetime64(start), np.datetime64(end)
+    lo = dates.searchsorted(start, side='left')
+    hi = dates.searchsorted(end, side='right')
+    window = data.iloc[lo:hi]
+    if columns is not None:
+        window = window[list(columns)]
+    return window
+
+
+def _migrate_csv(filename):
+    """Convert a legacy CSV table (and its journal) to the active backend"""
+    csv_path = os.path.splitext(filename)[0] + CsvBackend.suffix
+    if not os.path.exists(csv_path):
+        return
+    frames = [pd.read_csv(csv_path)]
+    csv_journal = csv_path + JOURNAL_SUFFIX
+    if os.path.exists(csv_journal) and os.path.getsize(csv_journal) > 0:
+        frames.append(_read_journal(csv_journal))
+    data = _merge(frames, _row_key(_table_name(filename)))
+    ensure_row_ids(data)
+    # Happens on the first read, before the table can have been cached
+    _write_table(data, filename)
+    if os.path.exists(csv_journal):
+        os.remove(csv_journal)
+
+
+def _database(filename):
+    """The SQLite database holding ``filename``; each user directory has its own"""
+    backend = get_backend()
+    if not isinstance(backend, SQLiteBackend):
+        return None
+    directory = os.path.dirname(filename)
+    if not directory:
+        return backend
+    with _locks_guard:
+        db = _databases.get(directory)
+        if db is None:
+            db = _databases[directory] = SQLiteBackend(os.path.join(directory, os.path.basename(backend.path)))
+        return db
+
+
+def user_path(filename, user_id=None):
+    """Where one user's copy of a table lives.
+
+    Every user gets a directory under ``USERS_DIR``, so reads, appends and
+    compactions only ever open that user's files. ``None`` is the original
+    single-user layout in the working directory.
+    """
+    if user_id is None:
+        return filename
+    user_id = str(user_id)
+    if not _USER_ID.match(user_id):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    directory = os.path.join(USERS_DIR, user_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def table_exists(filename):
+    """Whether a table has been stored in any supported format"""
+    csv_path = os.path.splitext(filename)[0] + CsvBackend.suffix
+    db = _database(filename)
+    if db is not None:
+        return db.has_table(_table_name(filename)) or os.path.exists(csv_path)
+    return any(os.path.exists(p) for p in (_base_path(filename), _journal_path(filename), csv_path))
+
+
+class TableCache:
+    """Process-wide LRU of loaded tables, shared by every session.
+
+    Entries are keyed by table path, which includes the user's directory, and
+    the version of the table. Every write through this module bumps the
+    version under the table's lock, so a frame read before a write can never
+    be stored after it. Least recently used tables are evicted once the
+    cached frames exceed ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (path, version) -> (frame, nbytes); only current versions
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _path(filename):
+        return os.path.abspath(filename)
+
+    def version(self, filename):
+        with self._lock:
+            return self._versions.get(self._path(filename), 0)
+
+    def get(self, filename):
+        """A copy-on-write view of the current version, or None"""
+        path = self._path(filename)
+        with self._lock:
+            key = (path, self._versions.get(path, 0))
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy(deep=False)
+
+    def put(self, filename, data, version, nbytes=None):
+        """Cache ``data`` as ``version`` of the table unless a write has superseded it"""
+        path = self._path(filename)
+        if nbytes is None:
+            nbytes = int(data.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if self._versions.get(path, 0) != version or nbytes > self.max_bytes:
+                return
+            self._drop((path, version))
+            self._entries[(path, version)] = (data.copy(deep=False), nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, filename):
+        """Drop the table and return its new version"""
+        path = self._path(filename)
+        with self._lock:
+            version = self._versions.get(path, 0)
+            self._drop((path, version))
+            self._versions[path] = version + 1
+            return version + 1
+
+    def append(self, filename, rows):
+        """Invalidate after an append, carrying a cached copy forward with ``rows`` added.
+
+        Only the new rows are typed and measured, so apart from copying the
+        cached arrays once an append costs O(rows), not O(history). Rows that
+        don't fit the cached dtypes drop the entry instead; the next get reads
+        the table again. Callers hold the table's lock, as for any other write.
+        """
+        path = self._path(filename)
+        with self._lock:
+            entry = self._entries.get((path, self._versions.get(path, 0)))
+        version = self.invalidate(filename)
+        if entry is None:
+            return
+        new = apply_schema(pd.DataFrame(rows), _table_name(filename))
+        merged = _insert_rows(entry[0], new, _row_key(_table_name(filename)))
+        if merged is not None:
+            # Replaced rows are not subtracted; the estimate errs on the large side
+            nbytes = entry[1] + int(new.memory_usage(index=False, deep=True).sum())
+            self.put(filename, merged, version, nbytes)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'tables': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+table_cache = TableCache()
+
+
+def _insert_rows(data, rows, key='id'):
+    """``data`` with typed ``rows`` added in date order, replacing rows with the same ``key``.
+
+    ``data`` must be sorted by date. Returns None if ``rows`` have columns
+    ``data`` lacks or values its dtypes can't hold.
+    """
+    if rows.empty:
+        return data
+    if not set(rows.columns) <= set(data.columns):
+        return None
+    rows = rows.reindex(columns=data.columns)
+    widened = {}
+    for column in data.columns:
+        dtype = data[column].dtype
+        values = rows[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            missing = pd.Index(values.dropna().unique()).difference(dtype.categories)
+            if len(missing):
+                # Sorted like the categories a fresh read would infer
+                widened[column] = data[column].cat.set_categories(dtype.categories.union(missing))
+                dtype = widened[column].dtype
+        try:
+            rows[column] = values.astype(dtype)
+        except (TypeError, ValueError):
+            return None
+    if widened:
+        data = data.assign(**widened)
+    if key in data.columns and rows[key].notna().any():
+        replaced = data[key].isin(rows[key].dropna())
+        if replaced.any():
+            data = data[~replaced.to_numpy()].reset_index(drop=True)
+    if 'date' not in data.columns or data.empty:
+        return sort_by_date(pd.concat([data, rows], ignore_index=True))
+    if rows['date'].isna().any() or not data['date'].is_monotonic_increasing:
+        return None
+    rows = rows.sort_values('date', kind='stable')
+    combined = pd.concat([data, rows], ignore_index=True)
+    positions = data['date'].searchsorted(rows['date'], side='right')
+    if (positions < len(data)).any():
+        order = np.insert(np.arange(len(data)), positions, np.arange(len(data), len(combined)))
+        combined = combined.take(order).reset_index(drop=True)
+    return combined
+
+
+def read_table(filename):
+    """Read a table as its base file plus any journalled appends, typed by ``apply_schema``"""
+    with _lock_for(filename):
+        db = _database(filename)
+        if db is not None:
+            if not db.has_table(_table_name(filename)):
+                _migrate_csv(filename)
+            if not db.has_table(_table_name(filename)):
+                return None
+            return apply_schema(db.read_table(_table_name(filename)), _table_name(filename))
+        backend = get_backend()
+        base = _base_path(filename)
+        if not isinstance(backend, CsvBackend) and not os.path.exists(base):
+            _migrate_csv(filename)
+        frames = []
+        if os.path.exists(base):
+            frames.append(backend.read(base))
+        journal = _journal_path(filename)
+        if os.path.exists(journal) and os.path.getsize(journal) > 0:
+            frames.append(_read_journal(journal))
+        if not frames:
+            return None
+        # Journalled rows are parsed from CSV, so the merged columns are typed once more
+        return apply_schema(_merge(frames, _row_key(_table_name(filename))), _table_name(filename))
+
+
+def read_date_range(filename, start, end, columns=None):
+    """Rows dated ``start`` to ``end`` (inclusive) read through the SQLite date index.
+
+    Returns None with the file backends, or before the table has been
+    migrated; the caller then loads the table and binary searches it.
+    """
+    db = _database(filename)
+    if db is None or not db.has_table(_table_name(filename)):
+        return None
+    start, end = (pd.Timestamp(value).strftime('%Y-%m-%d') for value in (start, end))
+    return db.fetch_range(_table_name(filename), start, end, columns)
+
+
+def _write_table(data, filename):
+    db = _database(filename)
+    if db is not None:
+        db.write_table(data, _table_name(filename))
+        return
+    base = _base_path(filename)
+    tmp = base + '.tmp'
+    get_backend().write(data, tmp)
+    os.replace(tmp, base)
+    journal = _journal_path(filename)
+    if os.path.exists(journal):
+        os.remove(journal)
+
+
+def write_table(data, filename):
+    """Atomically replace a table and discard its journal; ``data`` becomes the cached copy"""
+    with _lock_for(filename):
+        version = table_cache.invalidate(filename)
+        _write_table(data, filename)
+        table_cache.put(filename, data, version)
+
+
+def append_rows(filename, rows):
+    """Append rows to a table's journal; O(rows) regardless of history size.
+
+    A row whose key (the id, or the day for the rollup) is already in the
+    table replaces it.
+    """
+    if not rows:
+        return
+    db = _database(filename)
+    if db is not None:
+        with _lock_for(filename):
+            db.append_rows(_table_name(filename), rows)
+            table_cache.append(filename, rows)
+        return
+    journal = _journal_path(filename)
+    with _lock_for(filename):
+        if os.path.exists(journal):
+            _repair_tail(journal)
+        size = _append_journal(journal, pd.DataFrame(rows))
+        table_cache.append(filename, rows)
+    if size >= COMPACT_THRESHOLD_BYTES:
+        compact_in_background(filename)
+
+
+def _append_journal(journal, frame):
+    """Append a frame to a journal file and return the file's new size"""
+    header = _journal_header(journal)
+    if header is None:
+        payload = frame.to_csv(index=False)
+    else:
+        payload = frame.reindex(columns=header).to_csv(index=False, header=False)
+    _fsync_write(journal, payload.encode('utf-8'), 'a')
+    return os.path.getsize(journal)
+
+
+def write_chunks(filename, frames, progress=None):
+    """Replace a table with a stream of frames, holding only one in memory at a time.
+
+    The replacement is staged and swapped in once the last frame is written,
+    so a failure part-way leaves the old table intact. With SQLite that is
+    one transaction. Otherwise the first frame is written as the new base
+    file and the others as its journal, which is compacted in the background
+    as usual. ``progress(rows)`` is called after each frame. Returns the
+    number of rows written.
+    """
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for frame in frames:
+            yield frame
+            rows += len(frame)
+            if progress is not None:
+                progress(rows)
+
+    size = 0
+    db = _database(filename)
+    with _lock_for(filename):
+        try:
+            if db is not None:
+                db.write_frames(counted(), _table_name(filename))
+            else:
+                size = _stage_chunks(filename, counted())
+        finally:
+            table_cache.invalidate(filename)
+    if size >= COMPACT_THRESHOLD_BYTES:
+        compact_in_background(filename)
+    return rows
+
+
+def _stage_chunks(filename, frames):
+    """Write frames to a temporary base file and journal, then swap both in; returns the journal size"""
+    base, journal = _base_path(filename), _journal_path(filename)
+    base_tmp, journal_tmp = base + '.tmp', journal + '.tmp'
+    first = True
+    for path in (base_tmp, journal_tmp):
+        # Left over from an import that was interrupted
+        if os.path.exists(path):
+            os.remove(path)
+    try:
+        for frame in frames:
+            if first:
+                get_backend().write(frame, base_tmp)
+                first = False
+            else:
+                _append_journal(journal_tmp, frame)
+        if first:
+            return 0
+        os.replace(base_tmp, base)
+        if os.path.exists(journal_tmp):
+            os.replace(journal_tmp, journal)
+            return os.path.getsize(journal)
+        if os.path.exists(journal):
+            os.remove(journal)
+        return 0
+    finally:
+        for path in (base_tmp, journal_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def compact(filename):
+    """Fold the journal into the base file"""
+    if _database(filename) is not None:
+        return
+    journal = _journal_path(filename)
+    with _lock_for(filename):
+        if not os.path.exists(journal) or os.path.getsize(journal) == 0:
+            return
+        # Same rows, just rewritten, so any cached copy stays valid
+        _write_table(read_table(filename), filename)
+
+
+def compact_in_background(filename):
+    """Run ``compact`` on a daemon thread unless one is already running"""
+    key = os.path.abspath(filename)
+    with _locks_guard:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+
+    def run():
+        try:
+            compact(filename)
+        finally:
+            with _locks_guard:
+                _compacting.discard(key)
+
+    threading.Thread(target=run, name=f"compact-{os.path.basename(filename)}", daemon=True).start()
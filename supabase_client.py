@@ -1,13 +1,20 @@
+import datetime
+import functools
+import hashlib
+import json
+import math
 import os
-from typing import Optional, Dict, Any, List
+import re
+import threading
+import time
+import uuid
+import weakref
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Any, List, Iterable, Iterator, Set, Tuple
 
 import streamlit as st
 
-try:
-	from supabase import create_client, Client
-except Exception:  # pragma: no cover
-	create_client = None
-	Client = None  # type: ignore
+if TYPE_CHECKING:  # pragma: no cover
+	from supabase import Client
 
 
 SUPABASE_TABLES = {
@@ -18,52 +25,735 @@ SUPABASE_TABLES = {
 }
 
 
+_round_trips = threading.local()
+
+
+def reset_round_trips() -> None:
+	"""Reset the network round-trip counter for the current script run."""
+	_round_trips.count = 0
+
+
+def round_trips() -> int:
+	"""Number of Supabase requests made by the current script run.
+
+	Streamlit executes each session's script on its own thread, so the
+	counter is thread-local and reflects a single rerun.
+	"""
+	return getattr(_round_trips, "count", 0)
+
+
+def _count_round_trip() -> None:
+	_round_trips.count = round_trips() + 1
+
+
+def _execute(query: Any) -> Any:
+	_count_round_trip()
+	return query.execute()
+
+
+LOCAL_URL_PREFIX = "sqlite:///"
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _identifier(name: str) -> str:
+	if not _IDENTIFIER.match(name):
+		raise ValueError(f"Invalid column name: {name!r}")
+	return name
+
+
+def _split_top_level(expr: str) -> List[str]:
+	parts, depth, current = [], 0, ""
+	for char in expr:
+		if char == "," and depth == 0:
+			parts.append(current)
+			current = ""
+			continue
+		depth += char == "("
+		depth -= char == ")"
+		current += char
+	parts.append(current)
+	return parts
+
+
+def _logic_to_sql(expr: str, joiner: str, params: List[Any]) -> str:
+	"""Translate a PostgREST logic filter such as ``a.gt.1,and(b.eq.2,c.lt.3)``."""
+	clauses = []
+	for part in _split_top_level(expr):
+		group = re.match(r"^(and|or)\((.*)\)$", part)
+		if group:
+			clauses.append(_logic_to_sql(group.group(2), group.group(1), params))
+			continue
+		column, op, value = part.split(".", 2)
+		clauses.append(f"{_identifier(column)} {_OPERATORS[op]} ?")
+		params.append(value)
+	return "(" + f" {joiner} ".join(clauses) + ")"
+
+
+class _LocalResponse:
+	def __init__(self, data: List[Dict[str, Any]]) -> None:
+		self.data = data
+
+
+class _LocalQuery:
+	"""The subset of the postgrest query builder used by this module, on SQLite."""
+
+	def __init__(self, backend: Any, table: str) -> None:
+		self._backend = backend
+		self._table = _identifier(table)
+		self._action = "select"
+		self._columns = "*"
+		self._where: List[str] = []
+		self._params: List[Any] = []
+		self._order: List[str] = []
+		self._limit: Optional[int] = None
+		self._payload: List[Dict[str, Any]] = []
+
+	def select(self, columns: str = "*", count: Optional[str] = None) -> "_LocalQuery":
+		if columns != "*":
+			columns = ", ".join(_identifier(c.strip()) for c in columns.split(","))
+		self._columns = columns
+		return self
+
+	def _filter(self, column: str, op: str, value: Any) -> "_LocalQuery":
+		self._where.append(f"{_identifier(column)} {_OPERATORS[op]} ?")
+		self._params.append(value)
+		return self
+
+	def eq(self, column: str, value: Any) -> "_LocalQuery":
+		return self._filter(column, "eq", value)
+
+	def gt(self, column: str, value: Any) -> "_LocalQuery":
+		return self._filter(column, "gt", value)
+
+	def gte(self, column: str, value: Any) -> "_LocalQuery":
+		return self._filter(column, "gte", value)
+
+	def lt(self, column: str, value: Any) -> "_LocalQuery":
+		return self._filter(column, "lt", value)
+
+	def lte(self, column: str, value: Any) -> "_LocalQuery":
+		return self._filter(column, "lte", value)
+
+	def or_(self, filters: str) -> "_LocalQuery":
+		self._where.append(_logic_to_sql(filters, "or", self._params))
+		return self
+
+	def order(self, column: str, desc: bool = False) -> "_LocalQuery":
+		self._order.append(f"{_identifier(column)} {'desc' if desc else 'asc'}")
+		return self
+
+	def limit(self, size: int) -> "_LocalQuery":
+		self._limit = int(size)
+		return self
+
+	def upsert(self, rows: Any) -> "_LocalQuery":
+		self._action = "upsert"
+		self._payload = rows if isinstance(rows, list) else [rows]
+		return self
+
+	def insert(self, rows: Any) -> "_LocalQuery":
+		return self.upsert(rows)
+
+	def delete(self) -> "_LocalQuery":
+		self._action = "delete"
+		return self
+
+	def execute(self) -> _LocalResponse:
+		if self._action == "upsert":
+			self._backend.append_rows(self._table, self._payload)
+			return _LocalResponse(self._payload)
+		where = f" where {' and '.join(self._where)}" if self._where else ""
+		conn = self._backend.connect()
+		if self._action == "delete":
+			with conn:
+				conn.execute(f"delete from {self._table}{where}", self._params)
+			return _LocalResponse([])
+		sql = f"select {self._columns} from {self._table}{where}"
+		if self._order:
+			sql += " order by " + ", ".join(self._order)
+		if self._limit is not None:
+			sql += f" limit {self._limit}"
+		cursor = conn.execute(sql, self._params)
+		names = [d[0] for d in cursor.description]
+		return _LocalResponse([dict(zip(names, row)) for row in cursor.fetchall()])
+
+
+class LocalClient:
+	"""Offline stand-in for the Supabase client backed by an SQLite file.
+
+	Selected with ``SUPABASE_URL=sqlite:///path/to/file.db``; it shares the
+	schema of the local SQLite storage backend, so the sync layer can be
+	exercised without network access.
+	"""
+
+	def __init__(self, path: str) -> None:
+		from storage import SQLiteBackend
+
+		self.backend = SQLiteBackend(path)
+		self._users: Dict[str, "LocalClient"] = {}
+		self._users_lock = threading.Lock()
+
+	def table(self, name: str) -> _LocalQuery:
+		return _LocalQuery(self.backend, name)
+
+	def for_user(self, user_id: str) -> "LocalClient":
+		"""The user's own database file, standing in for row level security."""
+		from storage import USERS_DIR
+
+		with self._users_lock:
+			client = self._users.get(user_id)
+			if client is None:
+				# Parsing the id as a UUID also keeps it from escaping the directory
+				directory = os.path.join(os.path.dirname(self.backend.path), USERS_DIR, str(uuid.UUID(user_id)))
+				os.makedirs(directory, exist_ok=True)
+				client = self._users[user_id] = LocalClient(os.path.join(directory, os.path.basename(self.backend.path)))
+			return client
+
+	def schema(self) -> Dict[str, List[str]]:
+		conn = self.backend.connect()
+		tables = [row[0] for row in conn.execute("select name from sqlite_master where type = 'table'")]
+		# Users are partitioned by file, so the owner column of the Supabase tables is implied
+		return {
+			table: [row[1] for row in conn.execute(f"pragma table_info({table})")] + ["user_id"]
+			for table in tables
+		}
+
+
+def _create_client(url: str, key: str) -> Optional["Client"]:
+	if url.startswith(LOCAL_URL_PREFIX):
+		return LocalClient(url[len(LOCAL_URL_PREFIX):])
+	# The SDK takes a noticeable share of cold start, so it is only imported once configured
+	try:
+		from supabase import create_client
+	except Exception:  # pragma: no cover
+		return None
+	try:
+		client: "Client" = create_client(url, key)
+		return client
+	except Exception:
+		return None
+
+
+def _signed_in(session: Any) -> Dict[str, Any]:
+	return {
+		"user_id": session.user.id,
+		"access_token": session.access_token,
+		"refresh_token": session.refresh_token,
+		"expires_at": session.expires_at,
+	}
+
+
+def _auth_client(client: "Client") -> Any:
+	# A throwaway auth client, so the shared client never holds a user's session
+	from supabase_auth import SyncGoTrueClient
+
+	key = client.supabase_key
+	return SyncGoTrueClient(
+		url=str(client.auth_url),
+		headers={"apikey": key, "Authorization": f"Bearer {key}"},
+		auto_refresh_token=False,
+		persist_session=False,
+	)
+
+
+def sign_in(client: "Client", email: str, password: str) -> Dict[str, Any]:
+	"""Sign a user in with Supabase Auth and return their id and tokens.
+
+	With a ``LocalClient`` any password is accepted and the id is derived
+	from the email address.
+	"""
+	if isinstance(client, LocalClient):
+		user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"mailto:{email.strip().lower()}"))
+		return {"user_id": user_id, "access_token": None, "refresh_token": None, "expires_at": None}
+	response = _auth_client(client).sign_in_with_password({"email": email, "password": password})
+	return _signed_in(response.session)
+
+
+def refresh_sign_in(client: "Client", auth: Dict[str, Any]) -> Dict[str, Any]:
+	"""Return ``auth`` unchanged, or with new tokens if the access token expires within a minute."""
+	expires_at = auth.get("expires_at")
+	if not expires_at or expires_at - time.time() > 60:
+		return auth
+	response = _auth_client(client).refresh_session(auth["refresh_token"])
+	return dict(auth, **_signed_in(response.session))
+
+
+def user_client(client: "Client", auth: Dict[str, Any]) -> Any:
+	"""A view of ``client`` that acts as the signed-in user.
+
+	Requests carry the user's access token, so row level security limits
+	them to the user's rows, while still going through the shared client's
+	connection pool. Rebuild it after ``refresh_sign_in`` returns new tokens.
+	"""
+	if isinstance(client, LocalClient):
+		return client.for_user(auth["user_id"])
+	from postgrest import SyncPostgrestClient
+
+	# httpx headers are case-insensitive, so this replaces the anon key's Authorization
+	headers = client.postgrest.headers.copy()
+	headers["Authorization"] = f"Bearer {auth['access_token']}"
+	return SyncPostgrestClient(str(client.rest_url), headers=headers, http_client=client.postgrest.session)
+
+
+def ping(client: "Client") -> bool:
+	"""Cheapest round trip that shows the client can still reach the database."""
+	try:
+		_execute(client.table(SUPABASE_TABLES["user_profile"]).select("id").limit(1))
+		return True
+	except Exception:
+		return False
+
+
+# Seconds between liveness checks of a shared client; reruns in between reuse it untouched
+HEALTH_CHECK_INTERVAL = 60.0
+
+
+class _SharedClient:
+	def __init__(self, client: "Client") -> None:
+		self.client = client
+		self.checked_at = time.monotonic()
+
+
+_clients: Dict[Tuple[str, str], _SharedClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _secret(name: str) -> Optional[str]:
+	"""Read a Streamlit secret, or None when there is no secrets.toml"""
+	try:
+		return st.secrets.get(name, None)
+	except Exception:
+		return None
+
+
 def get_supabase_client() -> Optional["Client"]:
-	"""Initialize Supabase client from Streamlit secrets.
+	"""Return the process-wide Supabase client from Streamlit secrets.
+
+	The client (and its HTTP connection pool) is created once per URL and key
+	and shared by every session and rerun. At most every
+	``HEALTH_CHECK_INTERVAL`` seconds one caller pings it, and a client that
+	fails the ping is replaced by a fresh one.
 	Returns None if not configured properly or SDK missing.
 	"""
 	# Prefer Streamlit secrets
-	url = st.secrets.get("SUPABASE_URL", None)
-	key = st.secrets.get("SUPABASE_ANON_KEY", None)
+	url = _secret("SUPABASE_URL")
+	key = _secret("SUPABASE_ANON_KEY")
 	if not url or not key:
 		# Allow environment variables fallback for local testing
 		url = os.environ.get("SUPABASE_URL")
 		key = os.environ.get("SUPABASE_ANON_KEY")
 
-	if not url or not key:
+	if not url or not (key or url.startswith(LOCAL_URL_PREFIX)):
 		return None
-	if create_client is None:
-		return None
-	try:
-		client: Client = create_client(url, key)
-		return client
-	except Exception:
+	settings = (url, key or "")
+	with _clients_lock:
+		shared = _clients.get(settings)
+		if shared is None:
+			client = _create_client(url, key or "")
+			if client is None:
+				return None
+			_clients[settings] = _SharedClient(client)
+			return client
+		# Claim the check under the lock so only one session pings
+		due = time.monotonic() - shared.checked_at >= HEALTH_CHECK_INTERVAL
+		if due:
+			shared.checked_at = time.monotonic()
+	if due and not ping(shared.client):
+		client = _create_client(url, key or "")
+		if client is not None:
+			with _clients_lock:
+				_clients[settings] = _SharedClient(client)
+			return client
+	return shared.client
+
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SUPABASE_SCHEMA.sql")
+
+_CREATE_TABLE = re.compile(r"create table if not exists public\.(\w+) \((.*?)\n\);", re.IGNORECASE | re.DOTALL)
+_CONSTRAINTS = ("primary", "unique", "constraint", "foreign", "check")
+
+
+@functools.lru_cache(maxsize=None)
+def expected_schema(path: str = SCHEMA_PATH) -> Dict[str, List[str]]:
+	"""Tables and columns created by ``SUPABASE_SCHEMA.sql``."""
+	with open(path, encoding="utf-8") as f:
+		sql = f.read()
+	schema = {}
+	for table, body in _CREATE_TABLE.findall(sql):
+		names = (line.strip().split(None, 1)[0] for line in body.splitlines() if line.strip())
+		schema[table] = [name for name in names if name.lower() not in _CONSTRAINTS]
+	return schema
+
+
+def _openapi_schema(client: "Client") -> Optional[Dict[str, Optional[List[str]]]]:
+	"""Every table and its columns from the PostgREST OpenAPI root, in one request.
+
+	Returns None when the API key may not read the root.
+	"""
+	_count_round_trip()
+	response = client.postgrest.session.get("/")
+	if response.status_code in (401, 403, 404):
 		return None
+	response.raise_for_status()
+	definitions = response.json().get("definitions", {})
+	return {table: list(definition.get("properties", {})) for table, definition in definitions.items()}
+
+
+def _probe_schema(client: "Client", tables: Iterable[str]) -> Dict[str, Optional[List[str]]]:
+	"""Fallback: one indexed single-row read per table; columns are known only if it has rows."""
+	from postgrest.exceptions import APIError
+
+	schema: Dict[str, Optional[List[str]]] = {}
+	for table in tables:
+		try:
+			response = _execute(client.table(table).select("*").limit(1))
+		except APIError:
+			continue
+		schema[table] = list(response.data[0]) if response.data else None
+	return schema
+
+
+_schemas: "weakref.WeakKeyDictionary[Any, Dict[str, Optional[List[str]]]]" = weakref.WeakKeyDictionary()
+_schemas_lock = threading.Lock()
+
+
+def get_schema(client: "Client", refresh: bool = False) -> Dict[str, Optional[List[str]]]:
+	"""Tables visible to ``client`` mapped to their columns (None if unknown).
+
+	Fetched once per client and kept for the life of the process, so checks
+	after the first cost nothing and never touch table data. Network errors
+	propagate and are not cached. Pass ``refresh=True`` after changing the
+	schema.
+	"""
+	with _schemas_lock:
+		schema = None if refresh else _schemas.get(client)
+		if schema is None:
+			if isinstance(client, LocalClient):
+				schema = client.schema()
+			else:
+				schema = _openapi_schema(client)
+				if schema is None:
+					schema = _probe_schema(client, expected_schema())
+			_schemas[client] = schema
+		return schema
 
 
 def table_exists(client: "Client", table: str) -> bool:
 	try:
-		# Lightweight check: attempt a count(*) with limit 1
-		client.table(table).select("id", count="exact").limit(1).execute()
-		return True
+		return table in get_schema(client)
 	except Exception:
 		return False
 
 
-def fetch_all(client: "Client", table: str) -> List[Dict[str, Any]]:
-	resp = client.table(table).select("*").order("date", desc=False).execute()
-	return resp.data or []
+def schema_problems(client: "Client") -> List[str]:
+	"""Differences between the database and ``SUPABASE_SCHEMA.sql``, as messages."""
+	actual = get_schema(client)
+	problems = []
+	for table, columns in expected_schema().items():
+		if table not in actual:
+			problems.append(f"table {table} is missing")
+			continue
+		if actual[table] is None:
+			continue
+		missing = [column for column in columns if column not in actual[table]]
+		if missing:
+			problems.append(f"{table} is missing columns: {', '.join(missing)}")
+	return problems
+
+
+# Stay well below PostgREST's default max-rows cap (1000) so pages are never truncated
+PAGE_SIZE = 500
+
+
+# Tables with one row per date, paginated on date alone
+DATE_KEYED_TABLES = {"daily_rollup"}
+
+
+def _projection(columns: Optional[Iterable[str]], keys: List[str]) -> str:
+	if not columns or columns == "*":
+		return "*"
+	if isinstance(columns, str):
+		columns = [c.strip() for c in columns.split(",")]
+	# The keyset cursor needs its key columns even when the caller does not
+	wanted = list(dict.fromkeys([*keys, *columns]))
+	return ",".join(wanted)
+
+
+def iter_batches(
+	client: "Client",
+	table: str,
+	columns: Optional[Iterable[str]] = None,
+	since: Optional[str] = None,
+	until: Optional[str] = None,
+	batch_size: int = PAGE_SIZE,
+	newest_first: bool = False,
+) -> Iterator[List[Dict[str, Any]]]:
+	"""Yield a table in pages using keyset pagination on ``(date, id)``
+	(``date`` alone for one-row-per-day tables).
+
+	Each page is a separate request that resumes after the last row of the
+	previous one, so results are never silently capped and memory stays
+	bounded by ``batch_size``. Pass ``newest_first=True`` and stop iterating
+	once a recent window has been collected.
+	"""
+	keys = ["date"] if table in DATE_KEYED_TABLES else ["date", "id"]
+	select = _projection(columns, keys)
+	op = "lt" if newest_first else "gt"
+	cursor: Optional[Dict[str, Any]] = None
+	while True:
+		query = client.table(table).select(select)
+		if since:
+			query = query.gte("date", since)
+		if until:
+			query = query.lte("date", until)
+		if cursor is not None and len(keys) == 1:
+			query = getattr(query, op)("date", cursor["date"])
+		elif cursor is not None:
+			last_date, last_id = cursor["date"], cursor["id"]
+			query = query.or_(f"date.{op}.{last_date},and(date.eq.{last_date},id.{op}.{last_id})")
+		for key in keys:
+			query = query.order(key, desc=newest_first)
+		query = query.limit(batch_size)
+		rows = _execute(query).data or []
+		if rows:
+			yield rows
+		if len(rows) < batch_size:
+			return
+		cursor = rows[-1]
+
+
+def fetch_all(client: "Client", table: str, columns: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+	rows: List[Dict[str, Any]] = []
+	for batch in iter_batches(client, table, columns=columns):
+		rows.extend(batch)
+	return rows
+
+
+def fetch_since(
+	client: "Client", table: str, since: str, columns: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+	"""Fetch rows dated on or after ``since`` (an ISO date watermark)."""
+	rows: List[Dict[str, Any]] = []
+	for batch in iter_batches(client, table, columns=columns, since=since):
+		rows.extend(batch)
+	return rows
+
+
+def fetch_range(
+	client: "Client", table: str, start: str, end: str, columns: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+	"""Fetch rows with ``start <= date <= end``, filtered server-side."""
+	rows: List[Dict[str, Any]] = []
+	for batch in iter_batches(client, table, columns=columns, since=start, until=end):
+		rows.extend(batch)
+	return rows
+
+
+def fetch_daily_rollup(
+	client: "Client", start: str, end: str, columns: Optional[Iterable[str]] = None
+) -> List[Dict[str, Any]]:
+	"""Fetch pre-aggregated per-day totals maintained by the ``daily_rollup`` triggers."""
+	return fetch_range(client, "daily_rollup", start, end, columns)
 
 
 def upsert_rows(client: "Client", table: str, rows: List[Dict[str, Any]]) -> None:
 	if not rows:
 		return
-	client.table(table).upsert(rows).execute()
+	_execute(client.table(table).upsert(rows))
 
 
 def insert_row(client: "Client", table: str, row: Dict[str, Any]) -> None:
-	client.table(table).insert(row).execute()
+	_execute(client.table(table).insert(row))
 
 
 def delete_by_id(client: "Client", table: str, row_id: Any) -> None:
-	client.table(table).delete().eq("id", row_id).execute()
+	_execute(client.table(table).delete().eq("id", row_id))
+
+
+def _clean_value(value: Any) -> Any:
+	if isinstance(value, datetime.date):
+		# Typed date columns hold midnight timestamps; the tables store plain dates
+		return None if value != value else value.strftime("%Y-%m-%d")
+	if getattr(value, "dtype", None) == "float32":
+		# Shortest repr, so 70.1 is sent (and fingerprinted) as 70.1 rather than 70.09999847
+		value = float(str(value))
+	if hasattr(value, "item"):
+		value = value.item()
+	if isinstance(value, float) and math.isnan(value):
+		return None
+	return value
+
+
+def clean_row(row: Dict[str, Any]) -> Dict[str, Any]:
+	"""Convert a pandas record into a JSON-safe row (NaN -> None, numpy -> python)."""
+	return {k: _clean_value(v) for k, v in row.items()}
+
+
+def _normalize_number(value: Any) -> Any:
+	# Supabase returns numeric columns as ints where pandas keeps floats
+	if isinstance(value, float) and value.is_integer():
+		return int(value)
+	return value
+
+
+def row_fingerprint(row: Dict[str, Any], columns: Optional[Iterable[str]] = None) -> str:
+	"""Hash of a row's values; with ``columns`` only those count."""
+	if columns is not None:
+		row = {k: row.get(k) for k in columns}
+	normalized = {k: _normalize_number(v) for k, v in row.items() if v is not None}
+	payload = json.dumps(normalized, sort_keys=True, default=str)
+	return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# Rows per upsert when pushing, and the back-off after a failed push
+PUSH_BATCH = 500
+RETRY_BASE_SECONDS = 5.0
+RETRY_MAX_SECONDS = 300.0
+
+
+class DeltaSync:
+	"""Tracks what Supabase already holds and pushes only new or modified rows.
+
+	Rows are keyed by their ``id`` column. A fingerprint of the last synced
+	version of every row is kept per table, so pushing a batch costs one
+	upsert of the rows that actually changed. Rows whose upsert fails stay
+	pending and are retried by a later push, after a back-off that doubles
+	with each consecutive failure (see ``failures``). With ``pending_path`` (table
+	name -> file) the pending rows are also kept on disk, so they survive a
+	restart and are not lost to the next download from Supabase.
+
+	One tracker serves every session of a user (see ``get_delta_sync``), so
+	its state and pending file are only touched under its lock; a push holds
+	it until the upsert returns, so sessions never send the same rows twice.
+	"""
+
+	def __init__(self, pending_path: Optional[Callable[[str], str]] = None) -> None:
+		self._synced: Dict[str, Dict[str, str]] = {}
+		self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+		self._pending_path = pending_path
+		self._lock = threading.RLock()
+		# Consecutive failed pushes; 1 means this is the first since the last success
+		self.failures = 0
+		self._retry_at = 0.0
+
+	def _pending_rows(self, table: str) -> Dict[str, Dict[str, Any]]:
+		pending = self._pending.get(table)
+		if pending is None:
+			pending = self._pending[table] = {}
+			path = self._pending_path(table) if self._pending_path else None
+			if path and os.path.exists(path):
+				with open(path, encoding="utf-8") as f:
+					pending.update((str(row["id"]), row) for row in json.load(f))
+		return pending
+
+	def _save_pending(self, table: str) -> None:
+		if not self._pending_path:
+			return
+		path = self._pending_path(table)
+		pending = self._pending.get(table)
+		if not pending:
+			if os.path.exists(path):
+				os.remove(path)
+			return
+		tmp = path + ".tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			json.dump(list(pending.values()), f, default=str)
+		os.replace(tmp, path)
+
+	def pending_ids(self, table: str) -> Set[str]:
+		"""Ids of rows changed locally that Supabase does not have yet."""
+		with self._lock:
+			return set(self._pending_rows(table))
+
+	@staticmethod
+	def _columns(table: str) -> Optional[List[str]]:
+		# Rows read back from Supabase also carry its own columns (user_id), which local rows lack
+		from storage import TABLE_COLUMNS
+
+		return TABLE_COLUMNS.get(table)
+
+	def mark_synced(self, table: str, rows: Iterable[Dict[str, Any]]) -> None:
+		with self._lock:
+			synced = self._synced.setdefault(table, {})
+			pending = self._pending_rows(table)
+			cleared = False
+			for row in rows:
+				row = clean_row(row)
+				row_id = row.get("id")
+				if row_id is None:
+					continue
+				synced[str(row_id)] = row_fingerprint(row, self._columns(table))
+				cleared = pending.pop(str(row_id), None) is not None or cleared
+			if cleared:
+				self._save_pending(table)
+
+	def diff(self, table: str, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+		"""Return the rows that are new or differ from their last synced version."""
+		with self._lock:
+			synced = self._synced.get(table, {})
+			changed = []
+			for row in rows:
+				row = clean_row(row)
+				row_id = row.get("id")
+				if row_id is None:
+					continue
+				if synced.get(str(row_id)) != row_fingerprint(row, self._columns(table)):
+					changed.append(row)
+			return changed
+
+	def pending_count(self, table: Optional[str] = None) -> int:
+		with self._lock:
+			tables = [table] if table else list(self._pending)
+			return sum(len(self._pending_rows(t)) for t in tables)
+
+	def push(self, client: "Client", table: str, rows: Iterable[Dict[str, Any]] = ()) -> int:
+		"""Upsert changed rows (plus earlier failures) and return how many were sent.
+
+		While backing off from a failure the rows are only queued. A failed
+		upsert re-raises its error; the batches sent before it stay synced.
+		"""
+		with self._lock:
+			pending = self._pending_rows(table)
+			changed = self.diff(table, rows)
+			for row in changed:
+				pending[str(row["id"])] = row
+			if changed:
+				# On disk before the upsert, so a failure or restart cannot drop them
+				self._save_pending(table)
+			if not pending or time.monotonic() < self._retry_at:
+				return 0
+			rows = list(pending.values())
+			sent = 0
+			for offset in range(0, len(rows), PUSH_BATCH):
+				batch = rows[offset:offset + PUSH_BATCH]
+				try:
+					upsert_rows(client, table, batch)
+				except Exception:
+					self.failures += 1
+					delay = min(RETRY_BASE_SECONDS * 2 ** (self.failures - 1), RETRY_MAX_SECONDS)
+					self._retry_at = time.monotonic() + delay
+					raise
+				self.mark_synced(table, batch)
+				sent += len(batch)
+			self.failures = 0
+			self._retry_at = 0.0
+			return sent
+
+
+_delta_syncs: Dict[Optional[str], DeltaSync] = {}
+_delta_syncs_lock = threading.Lock()
+
+
+def get_delta_sync(user_id: Optional[str] = None, pending_path: Optional[Callable[[str], str]] = None) -> DeltaSync:
+	"""Return the process-wide sync tracker for ``user_id`` (None when nobody is signed in).
+
+	Sessions of the same user share it, as they share the user's tables and
+	pending files. ``pending_path`` is only used when the tracker is first created.
+	"""
+	with _delta_syncs_lock:
+		delta_sync = _delta_syncs.get(user_id)
+		if delta_sync is None:
+			delta_sync = _delta_syncs[user_id] = DeltaSync(pending_path)
+		return delta_sync
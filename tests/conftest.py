@@ -0,0 +1,110 @@
+"""Shared fixtures: a local stub of the AI provider HTTP APIs"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubAPI:
+    """Hugging Face and OpenAI-style chat endpoints with configurable latency and failures.
+
+    ``latency[kind]`` delays every response and ``fail[kind]`` answers that
+    many requests with ``status[kind]`` before succeeding again (-1 fails
+    them all), where ``kind`` is "hf" or "chat".
+    """
+
+    def __init__(self):
+        self.latency = {"hf": 0.0, "chat": 0.0}
+        self.fail = {"hf": 0, "chat": 0}
+        self.status = {"hf": 503, "chat": 500}
+        self.calls = {"hf": 0, "chat": 0}
+        self.connections = set()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def _respond(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            if self.fail[kind]:
+                if self.fail[kind] > 0:
+                    self.fail[kind] -= 1
+                return self.status[kind]
+        return 200
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send_events(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for event in events + ["[DONE]"]:
+                    data = f"data: {event}\n\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                kind = "chat" if self.path.endswith("/chat/completions") else "hf"
+                api.connections.add(self.client_address)
+                status = api._respond(kind)
+                time.sleep(api.latency[kind])
+                try:
+                    self._reply(kind, status, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting (a timeout or a losing hedge)
+                    pass
+
+            def _reply(self, kind, status, body):
+                if status != 200:
+                    return self._send(status, b'{"error": "unavailable"}')
+                words = ["Hel", "lo"]
+                if body.get("stream"):
+                    if kind == "chat":
+                        events = [json.dumps({"choices": [{"delta": {"content": w}}]}) for w in words]
+                    else:
+                        events = [json.dumps({"token": {"text": w}}) for w in words]
+                    return self._send_events(events)
+                if kind == "chat":
+                    reply = {"choices": [{"message": {"content": "chat: " + body["messages"][-1]["content"]}}]}
+                else:
+                    inputs = body["inputs"]
+                    if isinstance(inputs, list):
+                        reply = [[{"generated_text": "hf: " + text}] for text in inputs]
+                    else:
+                        reply = [{"generated_text": "hf: " + inputs}]
+                self._send(200, json.dumps(reply).encode())
+
+        return Handler
+
+
+@pytest.fixture
+def stub_api():
+    api = StubAPI()
+    thread = threading.Thread(target=api.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield api
+    api.server.shutdown()
+    api.server.server_close()
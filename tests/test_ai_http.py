@@ -0,0 +1,67 @@
+"""Pooled, retrying HTTP session of HealthAI against the local stub API"""
+import time
+
+import pytest
+
+import ai_helper
+
+
+@pytest.fixture
+def health_ai(stub_api, monkeypatch):
+    monkeypatch.setenv("HUGGINGFACE_TOKEN", "test")
+    monkeypatch.setenv("HF_API_URL", stub_api.url + "/models")
+    for name in ("GROQ_API_KEY", "OPENAI_API_KEY", "LOCAL_AI_MODEL"):
+        monkeypatch.setenv(name, "")
+    ai = ai_helper.HealthAI()
+    # Nothing cached by other tests, and retries fast enough to measure
+    ai.cache = ai_helper.ResponseCache()
+    ai.http = ai_helper.build_http_session(retries=3, backoff_factor=0.1)
+    yield ai
+    ai.shutdown()
+
+
+def test_connection_is_kept_alive(health_ai, stub_api):
+    answers = [health_ai._complete(f"prompt {i}") for i in range(20)]
+    assert answers == [f"hf: prompt {i}" for i in range(20)]
+    assert len(stub_api.connections) == 1
+
+
+def test_loading_model_is_retried_with_backoff(health_ai, stub_api):
+    stub_api.fail["hf"] = 2
+    start = time.perf_counter()
+    assert health_ai._complete("retry") == "hf: retry"
+    assert stub_api.calls["hf"] == 3
+    # No wait before the first retry, then backoff_factor * 2
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_retries_are_bounded(health_ai, stub_api):
+    stub_api.fail["hf"] = -1
+    assert health_ai._complete("gives up") == "Model is loading. Please try again in a few seconds."
+    assert stub_api.calls["hf"] == 4
+
+
+def test_errors_are_not_cached(health_ai, stub_api):
+    stub_api.fail["hf"] = -1
+    health_ai._complete("later")
+    stub_api.fail["hf"] = 0
+    assert health_ai._complete("later") == "hf: later"
+
+
+def test_connect_and_read_timeouts_are_separate(stub_api, monkeypatch):
+    monkeypatch.setenv("AI_READ_TIMEOUT", "0.2")
+    ai = ai_helper.HealthAI()
+    try:
+        assert ai.timeout == (ai_helper.CONNECT_TIMEOUT, 0.2)
+    finally:
+        ai.shutdown()
+
+
+def test_slow_response_times_out_without_retrying(health_ai, stub_api):
+    health_ai.timeout = (1.0, 0.2)
+    stub_api.latency["hf"] = 0.5
+    start = time.perf_counter()
+    answer = health_ai._complete("slow")
+    assert answer.startswith("AI request failed")
+    assert stub_api.calls["hf"] == 1
+    assert time.perf_counter() - start < 0.5
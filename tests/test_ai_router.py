@@ -0,0 +1,209 @@
+"""Provider routing: ranking, hedging and circuit breaking with fake providers"""
+import threading
+import time
+
+import pytest
+
+import ai_helper
+from ai_router import Provider, ProviderError, ProviderRouter
+
+
+class FakeProvider:
+    """A provider answering with its own name after ``latency`` seconds"""
+
+    def __init__(self, name, latency=0.0, fail=False):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    def complete(self, prompt, parameters):
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise ProviderError(f"{self.name} is down")
+        return self.name
+
+    def stream(self, prompt, parameters, cancel=None):
+        yield from self.complete(prompt, parameters)
+
+    def provider(self):
+        return Provider(self.name, "model", self.complete, self.stream)
+
+
+@pytest.fixture
+def make_router():
+    routers = []
+
+    def make(*fakes, **options):
+        router = ProviderRouter([fake.provider() for fake in fakes], **options)
+        routers.append(router)
+        return router
+
+    yield make
+    for router in routers:
+        router.shutdown()
+
+
+def test_fastest_provider_wins_once_measured(make_router):
+    slow, fast = FakeProvider("slow", 0.1), FakeProvider("fast", 0.01)
+    router = make_router(slow, fast, hedge_after=1.0)
+    answers = [router.complete("prompt", {}) for _ in range(10)]
+    # Both are tried while they have no history, then the faster one is preferred
+    assert answers[2:] == ["fast"] * 8
+    assert slow.calls == 1
+    stats = router.stats()
+    assert stats["fast"]["p50"] < stats["slow"]["p50"]
+
+
+def test_stalled_request_is_hedged(make_router):
+    primary, backup = FakeProvider("primary", 0.01), FakeProvider("backup", 0.2)
+    router = make_router(primary, backup, hedge_after=0.5)
+    router.complete("prompt", {})
+    router.complete("prompt", {})
+    for _ in range(10):
+        assert router.complete("prompt", {}) == "primary"
+    primary.latency = 2.0
+    start = time.perf_counter()
+    assert router.complete("prompt", {}) == "backup"
+    # Hedged after primary's p95 rather than after hedge_after
+    assert time.perf_counter() - start < 0.5
+
+
+def test_unmeasured_provider_is_hedged_after_hedge_after(make_router):
+    stalled, backup = FakeProvider("stalled", 1.0), FakeProvider("backup", 0.0)
+    router = make_router(stalled, backup, hedge_after=0.1)
+    start = time.perf_counter()
+    assert router.complete("prompt", {}) == "backup"
+    assert 0.1 <= time.perf_counter() - start < 0.5
+
+
+def test_failing_provider_opens_circuit(make_router):
+    bad, good = FakeProvider("bad", fail=True), FakeProvider("good", 0.01)
+    router = make_router(bad, good, hedge_after=5.0, failure_threshold=3, cooldown_seconds=0.3)
+    answers = [router.complete("prompt", {}) for _ in range(6)]
+    assert answers == ["good"] * 6
+    assert bad.calls == 3
+    assert router.stats()["bad"]["circuit_open"]
+    assert [p.name for p in router.ranked()] == ["good"]
+
+
+def test_open_circuit_sheds_load(make_router):
+    only = FakeProvider("only", fail=True)
+    router = make_router(only, failure_threshold=2, cooldown_seconds=30)
+    for _ in range(2):
+        with pytest.raises(ProviderError, match="is down"):
+            router.complete("prompt", {})
+    for _ in range(10):
+        with pytest.raises(ProviderError, match="temporarily unavailable"):
+            router.complete("prompt", {})
+    with pytest.raises(ProviderError, match="temporarily unavailable"):
+        list(router.stream("prompt", {}))
+    assert only.calls == 2
+
+
+def test_half_open_circuit_allows_one_trial(make_router):
+    flaky = FakeProvider("flaky", fail=True)
+    router = make_router(flaky, failure_threshold=2, cooldown_seconds=0.2)
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            router.complete("prompt", {})
+    time.sleep(0.25)
+    flaky.latency = 0.2
+    errors = []
+
+    def request():
+        try:
+            router.complete("prompt", {})
+        except ProviderError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert flaky.calls == 3
+    assert errors.count("flaky is down") == 1
+    # The failed trial re-opens the circuit for another cooldown
+    assert router.stats()["flaky"]["circuit_open"]
+
+
+def test_circuit_closes_after_successful_trial(make_router):
+    flaky = FakeProvider("flaky", fail=True)
+    router = make_router(flaky, failure_threshold=2, cooldown_seconds=0.2)
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            router.complete("prompt", {})
+    assert router.stats()["flaky"]["circuit_open"]
+    time.sleep(0.25)
+    flaky.fail = False
+    assert router.complete("prompt", {}) == "flaky"
+    assert not router.stats()["flaky"]["circuit_open"]
+
+
+def test_error_rate_opens_circuit(make_router):
+    flaky = FakeProvider("flaky")
+    router = make_router(flaky, failure_threshold=100, max_error_rate=0.4)
+    for i in range(10):
+        flaky.fail = i % 2 == 1
+        try:
+            router.complete("prompt", {})
+        except ProviderError:
+            pass
+    assert router.stats()["flaky"]["error_rate"] == 0.5
+    assert router.stats()["flaky"]["circuit_open"]
+
+
+def test_last_error_is_raised_when_all_fail(make_router):
+    router = make_router(FakeProvider("one", fail=True), FakeProvider("two", fail=True))
+    with pytest.raises(ProviderError, match="is down"):
+        router.complete("prompt", {})
+
+
+def test_stream_fails_over_before_first_chunk(make_router):
+    bad, good = FakeProvider("bad", fail=True), FakeProvider("good")
+    router = make_router(bad, good)
+    assert "".join(router.stream("prompt", {})) == "good"
+    assert router.stats()["bad"]["requests"] == 1
+
+
+def test_no_providers(make_router):
+    router = make_router()
+    with pytest.raises(ProviderError, match="not configured"):
+        router.complete("prompt", {})
+    with pytest.raises(ProviderError, match="not configured"):
+        list(router.stream("prompt", {}))
+
+
+@pytest.fixture
+def routed_ai(stub_api, monkeypatch):
+    monkeypatch.setenv("HUGGINGFACE_TOKEN", "test")
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setenv("HF_API_URL", stub_api.url + "/models")
+    monkeypatch.setenv("GROQ_API_URL", stub_api.url + "/groq/v1")
+    monkeypatch.setenv("AI_BREAKER_FAILURES", "2")
+    for name in ("OPENAI_API_KEY", "LOCAL_AI_MODEL"):
+        monkeypatch.setenv(name, "")
+    ai = ai_helper.HealthAI()
+    ai.cache = ai_helper.ResponseCache()
+    ai.http = ai_helper.build_http_session(retries=0)
+    yield ai
+    ai.shutdown()
+
+
+def test_health_ai_prefers_faster_provider(routed_ai, stub_api):
+    assert [p.name for p in routed_ai.router.providers] == ["huggingface", "groq"]
+    stub_api.latency["hf"] = 0.2
+    answers = [routed_ai._complete(f"question {i}") for i in range(6)]
+    assert answers[-1] == "chat: question 5"
+    assert stub_api.calls["hf"] == 1
+
+
+def test_health_ai_fails_over_when_provider_errors(routed_ai, stub_api):
+    stub_api.latency["hf"] = 0.05
+    stub_api.fail["chat"] = -1
+    answers = [routed_ai._complete(f"question {i}") for i in range(4)]
+    assert answers == [f"hf: question {i}" for i in range(4)]
+    assert routed_ai.provider_stats()["groq"]["circuit_open"]
+    assert "".join(routed_ai._stream("streamed")) == "Hello"
@@ -0,0 +1,8 @@
+"""Cold start of the app, measured by profile_imports"""
+import profile_imports
+
+
+def test_first_render_leaves_lazy_modules_unimported():
+    imports = profile_imports.profile()
+    assert imports, "no import timings were recorded"
+    assert profile_imports.eager_imports(imports) == []
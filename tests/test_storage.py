@@ -0,0 +1,82 @@
+"""Journalled tables and the shared table cache, on the CSV backend in a temporary directory"""
+import pandas as pd
+import pytest
+
+import storage
+
+
+@pytest.fixture
+def csv_storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage.set_backend(storage.BACKENDS["csv"]())
+    yield tmp_path
+    storage.set_backend(None)
+
+
+def diet_rows(*entries):
+    return [
+        {"date": date, "meal_type": meal, "food_name": food, "calories": calories,
+         "protein": 10.0, "carbs": 20.0, "fat": 5.0, "id": storage.new_row_id()}
+        for date, meal, food, calories in entries
+    ]
+
+
+def fresh_read(filename):
+    return storage.sort_by_date(storage.read_table(filename))
+
+
+def test_stale_put_is_refused():
+    cache = storage.TableCache()
+    frame = pd.DataFrame({"date": pd.to_datetime(["2024-01-01"]), "weight": [70.0]})
+    version = cache.version("weight_log.csv")
+    # A write lands between reading the table and caching what was read
+    cache.invalidate("weight_log.csv")
+    cache.put("weight_log.csv", frame, version)
+    assert cache.get("weight_log.csv") is None
+    assert cache.stats()["tables"] == 0 and cache.bytes == 0
+    cache.put("weight_log.csv", frame, cache.version("weight_log.csv"))
+    assert cache.get("weight_log.csv") is not None
+
+
+def test_back_dated_append_keeps_date_order(csv_storage):
+    table = storage.apply_schema(pd.DataFrame(diet_rows(
+        ("2024-01-01", "Breakfast", "Oats", 300),
+        ("2024-01-03", "Lunch", "Soup", 400),
+        ("2024-01-05", "Dinner", "Pasta", 700),
+    )), "diet_log")
+    storage.write_table(table, "diet_log.csv")
+    storage.append_rows("diet_log.csv", diet_rows(
+        ("2024-01-03", "Snack", "Apple", 80),
+        ("2024-01-02", "Brunch", "Eggs", 250),
+        ("2024-01-06", "Lunch", "Salad", 350),
+    ))
+    cached = storage.table_cache.get("diet_log.csv")
+    assert cached is not None
+    assert cached["date"].is_monotonic_increasing
+    # Equal dates keep their insertion order, as a stable sort of a fresh read does
+    assert list(cached["food_name"]) == ["Oats", "Eggs", "Soup", "Apple", "Pasta", "Salad"]
+    storage.table_cache.invalidate("diet_log.csv")
+    pd.testing.assert_frame_equal(cached, fresh_read("diet_log.csv"))
+
+
+def test_append_replaces_row_with_same_id(csv_storage):
+    rows = diet_rows(("2024-01-01", "Breakfast", "Oats", 300), ("2024-01-02", "Lunch", "Soup", 400))
+    storage.write_table(storage.apply_schema(pd.DataFrame(rows), "diet_log"), "diet_log.csv")
+    storage.append_rows("diet_log.csv", [dict(rows[0], calories=350.0)])
+    cached = storage.table_cache.get("diet_log.csv")
+    assert list(cached["calories"]) == [350.0, 400.0]
+    storage.table_cache.invalidate("diet_log.csv")
+    pd.testing.assert_frame_equal(cached, fresh_read("diet_log.csv"))
+
+
+def test_torn_journal_tail_is_ignored(csv_storage):
+    storage.append_rows("weight_log.csv", [{"date": "2024-01-01", "weight": 70.0, "id": "a"}])
+    journal = storage._journal_path("weight_log.csv")
+    # An append interrupted part-way through its line
+    with open(journal, "ab") as f:
+        f.write(b"2024-01-02,69.")
+    assert list(storage.read_table("weight_log.csv")["id"]) == ["a"]
+    storage.append_rows("weight_log.csv", [{"date": "2024-01-03", "weight": 69.5, "id": "b"}])
+    data = storage.read_table("weight_log.csv")
+    assert list(data["id"]) == ["a", "b"]
+    assert list(data["weight"]) == [70.0, 69.5]
@@ -0,0 +1,125 @@
+"""Syncing with Supabase, against the offline SQLite stand-in (LocalClient)"""
+import json
+import time
+
+import pytest
+
+import supabase_client
+from supabase_client import DeltaSync, LocalClient
+
+
+class FlakyClient:
+    """A LocalClient whose upserts fail while ``down`` is set"""
+
+    def __init__(self, path):
+        self.local = LocalClient(path)
+        self.down = False
+        self.upserts = 0
+
+    def table(self, name):
+        query = self.local.table(name)
+        upsert = query.upsert
+
+        def flaky_upsert(rows):
+            self.upserts += 1
+            if self.down:
+                raise ConnectionError("Supabase is unreachable")
+            return upsert(rows)
+
+        query.upsert = flaky_upsert
+        return query
+
+    def remote_ids(self, table):
+        return sorted(self.local.backend.read_table(table)["id"])
+
+
+@pytest.fixture
+def remote(tmp_path):
+    return FlakyClient(str(tmp_path / "remote.db"))
+
+
+def weights(*entries):
+    return [{"date": date, "weight": weight, "id": row_id} for row_id, date, weight in entries]
+
+
+def test_push_sends_only_changes_and_backs_off(tmp_path, remote, monkeypatch):
+    monkeypatch.setattr(supabase_client, "RETRY_BASE_SECONDS", 0.1)
+    pending_path = lambda table: str(tmp_path / f"{table}.pending")
+    sync = DeltaSync(pending_path)
+    rows = weights(("a", "2024-01-01", 70.0), ("b", "2024-01-02", 69.8), ("c", "2024-01-03", 69.5))
+
+    remote.down = True
+    with pytest.raises(ConnectionError):
+        sync.push(remote, "weight_log", rows)
+    assert sync.failures == 1
+    with open(pending_path("weight_log"), encoding="utf-8") as f:
+        assert sorted(row["id"] for row in json.load(f)) == ["a", "b", "c"]
+
+    # Backing off: new rows are only queued, even though Supabase is back
+    remote.down = False
+    upserts = remote.upserts
+    assert sync.push(remote, "weight_log", weights(("d", "2024-01-04", 69.4))) == 0
+    assert remote.upserts == upserts
+    assert sync.pending_count("weight_log") == 4
+    # The pending rows survive a restart
+    assert DeltaSync(pending_path).pending_ids("weight_log") == {"a", "b", "c", "d"}
+
+    time.sleep(0.15)
+    assert sync.push(remote, "weight_log") == 4
+    assert remote.remote_ids("weight_log") == ["a", "b", "c", "d"]
+    assert sync.failures == 0 and sync.pending_count("weight_log") == 0
+    assert not (tmp_path / "weight_log.pending").exists()
+
+    # Only the edited row differs from what was synced
+    rows[1]["weight"] = 69.9
+    assert [row["id"] for row in sync.diff("weight_log", rows)] == ["b"]
+    assert sync.push(remote, "weight_log", rows) == 1
+
+
+def test_back_off_doubles_with_each_failure(remote, monkeypatch):
+    monkeypatch.setattr(supabase_client, "RETRY_BASE_SECONDS", 0.1)
+    sync = DeltaSync()
+    remote.down = True
+    for failures, delay in ((1, 0.1), (2, 0.2)):
+        with pytest.raises(ConnectionError):
+            sync.push(remote, "weight_log", weights(("a", "2024-01-01", 70.0)))
+        assert sync.failures == failures
+        assert sync._retry_at - time.monotonic() == pytest.approx(delay, abs=0.05)
+        time.sleep(delay + 0.02)
+
+
+def test_rows_read_back_from_supabase_are_not_pushed_again(remote):
+    sync = DeltaSync()
+    rows = weights(("a", "2024-01-01", 70.0))
+    sync.push(remote, "weight_log", rows)
+    # Supabase returns its own owner column too
+    sync.mark_synced("weight_log", [dict(rows[0], user_id="someone")])
+    assert sync.diff("weight_log", rows) == []
+
+
+@pytest.fixture
+def diet_remote(tmp_path):
+    client = LocalClient(str(tmp_path / "remote.db"))
+    # Five meals on the 2nd straddle the page boundaries at batch_size=3
+    dates = ["2024-01-01"] * 2 + ["2024-01-02"] * 5 + ["2024-01-03"]
+    rows = [{"date": date, "meal_type": "Lunch", "food_name": f"food {i}", "calories": 100.0 + i,
+             "protein": 1.0, "carbs": 1.0, "fat": 1.0, "id": f"{i:02d}"}
+            for i, date in enumerate(dates)]
+    client.backend.append_rows("diet_log", rows[::-1])
+    return client
+
+
+def test_keyset_pages_cross_equal_dates(diet_remote):
+    pages = list(supabase_client.iter_batches(diet_remote, "diet_log", batch_size=3))
+    assert [len(page) for page in pages] == [3, 3, 2]
+    ids = [row["id"] for page in pages for row in page]
+    assert ids == [f"{i:02d}" for i in range(8)]
+
+
+def test_keyset_pages_newest_first_and_since(diet_remote):
+    pages = supabase_client.iter_batches(diet_remote, "diet_log", batch_size=2, newest_first=True)
+    assert [row["id"] for page in pages for row in page] == [f"{i:02d}" for i in reversed(range(8))]
+    rows = supabase_client.fetch_since(diet_remote, "diet_log", "2024-01-02", columns=["calories"])
+    assert [row["id"] for row in rows] == [f"{i:02d}" for i in range(2, 8)]
+    # The cursor's key columns are selected even when not asked for
+    assert set(rows[0]) == {"date", "id", "calories"}